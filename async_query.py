@@ -0,0 +1,83 @@
+''' asyncio version of cache.run_query.
+
+`run_query_async` solves the query in a worker thread with its own z3 Context,
+so it does not block the event loop and many queries can be awaited at once,
+e.g.
+
+    results = await asyncio.gather(*[run_query_async(c, s, v, 60)
+                                     for (c, s, v) in queries])
+
+Cancelling the task interrupts Z3 with `Solver.interrupt()`. Results are read
+from and written to the same cache as run_query. '''
+
+import asyncio
+import threading
+import time
+import z3
+
+from cache import QueryResult, lookup, store
+from config import ModelConfig
+from pyz3_utils import MySolver
+from utils import model_to_dict
+from variables import VariableNames, Variables
+
+# Seconds between interrupts while waiting for a cancelled query to stop
+INTERRUPT_INTERVAL = 0.05
+
+
+def solve_in_context(c: ModelConfig, solver: z3.Solver, smt2: str,
+                     v: VariableNames, timeout: float,
+                     cancelled: threading.Event) -> QueryResult:
+    ''' Runs in a worker thread. `solver` belongs to a Context that is only
+    used by this thread '''
+    solver.from_string(smt2)
+    solver.set(timeout=int(timeout * 1000))
+    start = time.time()
+    if cancelled.is_set():
+        # Cancelled before Z3 started, so interrupt() had nothing to stop
+        satisfiable = "unknown"
+    else:
+        satisfiable = str(solver.check())
+    solve_time = time.time() - start
+
+    model = None
+    if satisfiable == "sat":
+        model = model_to_dict(solver.model())
+        if c.simplify:
+            # Imported here since it pulls in numpy and scipy
+            from clean_output import simplify_solution
+            model = simplify_solution(c, model, solver.assertions())
+    return QueryResult(satisfiable, model, c, v, timeout, solve_time)
+
+
+async def run_query_async(c: ModelConfig, s: MySolver, v: Variables,
+                          timeout: float = 10) -> QueryResult:
+    fname, qres = lookup(c, s, timeout)
+    if qres is not None:
+        return qres
+
+    # Z3 contexts are not thread safe, so the worker thread gets its own. The
+    # query is transferred as text, which is produced here, in the thread that
+    # owns `s`
+    solver = z3.Solver(ctx=z3.Context())
+    smt2 = s.to_smt2()
+    cancelled = threading.Event()
+    loop = asyncio.get_running_loop()
+    fut = loop.run_in_executor(None, solve_in_context, c, solver, smt2,
+                               VariableNames(v), timeout, cancelled)
+    try:
+        # Shield so that cancelling us does not abandon the thread before Z3
+        # has been told to stop
+        qres = await asyncio.shield(fut)
+    except asyncio.CancelledError:
+        cancelled.set()
+        # interrupt() only stops a check() that is already running. The
+        # worker may have tested `cancelled` just before we set it and not
+        # have started Z3 yet, so keep interrupting until it returns
+        while not fut.done():
+            solver.interrupt()
+            await asyncio.wait([fut], timeout=INTERRUPT_INTERVAL)
+        raise
+
+    store(fname, qres)
+    return qres
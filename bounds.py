@@ -0,0 +1,217 @@
+''' Static bound propagation over the constraints built by `make_solver`.
+
+Many variables have bounds that follow from the configuration but are never
+stated, e.g. S[t] <= C*t - W[t] and S[t] >= 0 bound W[t] above by C*t. With
+`ModelConfig.bound_propagation` set, `make_solver` derives an interval for
+every Real and Int by propagating bounds through the linear constraints
+(ignoring those under Implies, Or, etc.), and asserts the ones that are
+tighter than what the constraints state directly. Each derived bound is
+implied by the constraints, so this does not change any result.
+
+Bounds are constants. Terms that involve an unbounded variable, such as
+alpha when `ModelConfig.alpha` is None, do not produce bounds. '''
+
+from fractions import Fraction
+from typing import Dict, List, Optional, Set, Tuple
+import z3
+
+from config import ModelConfig
+from pyz3_utils import MySolver
+from variables import Variables
+
+# A linear term: coefficient of each variable and a constant
+Linear = Tuple[Dict[str, Fraction], Fraction]
+# Lower and upper bound. None means unbounded
+Interval = Tuple[Optional[Fraction], Optional[Fraction]]
+
+# Give up after every constraint has been revisited this many times on
+# average, since bounds can creep towards their limit forever on cycles
+MAX_VISITS = 20
+
+
+class BoundPropagator:
+    def __init__(self):
+        # Constraints of the form `term <= 0` or, if `eq`, `term == 0`
+        self.constraints: List[Tuple[Linear, bool]] = []
+        # Variable name -> Z3 expression
+        self.vars: Dict[str, z3.ArithRef] = {}
+        # Bounds stated directly by single-variable constraints
+        self.explicit: Dict[str, Interval] = {}
+
+    def linear(self, e: z3.ExprRef) -> Optional[Linear]:
+        ''' `e` as a linear term, or None if it is not one '''
+        if z3.is_int_value(e):
+            return ({}, Fraction(e.as_long()))
+        if z3.is_rational_value(e):
+            return ({}, Fraction(e.numerator_as_long(),
+                                 e.denominator_as_long()))
+        if z3.is_const(e) and e.decl().kind() == z3.Z3_OP_UNINTERPRETED:
+            if not z3.is_arith(e):
+                return None
+            self.vars[str(e)] = e
+            return ({str(e): Fraction(1)}, Fraction(0))
+        kind = e.decl().kind() if z3.is_app(e) else None
+        if kind in [z3.Z3_OP_TO_REAL, z3.Z3_OP_TO_INT]:
+            # Rounding makes to_int non-linear
+            if kind == z3.Z3_OP_TO_INT:
+                return None
+            return self.linear(e.arg(0))
+
+        args = [self.linear(x) for x in e.children()]
+        if any(x is None for x in args) or len(args) == 0:
+            return None
+        if kind == z3.Z3_OP_ADD or kind == z3.Z3_OP_SUB:
+            coeffs: Dict[str, Fraction] = {}
+            const = Fraction(0)
+            for i, (c, k) in enumerate(args):
+                sign = -1 if kind == z3.Z3_OP_SUB and i > 0 else 1
+                for x, a in c.items():
+                    coeffs[x] = coeffs.get(x, Fraction(0)) + sign * a
+                const += sign * k
+            return ({x: a for x, a in coeffs.items() if a != 0}, const)
+        if kind == z3.Z3_OP_UMINUS:
+            c, k = args[0]
+            return ({x: -a for x, a in c.items()}, -k)
+        if kind == z3.Z3_OP_MUL:
+            res: Linear = ({}, Fraction(1))
+            for c, k in args:
+                if len(c) > 0 and len(res[0]) > 0:
+                    return None
+                if len(c) == 0:
+                    res = ({x: a * k for x, a in res[0].items()}, res[1] * k)
+                else:
+                    res = ({x: a * res[1] for x, a in c.items()}, k * res[1])
+            return res
+        if kind == z3.Z3_OP_DIV and len(args[1][0]) == 0 and args[1][1] != 0:
+            c, k = args[0]
+            d = args[1][1]
+            return ({x: a / d for x, a in c.items()}, k / d)
+        return None
+
+    def add(self, e: z3.ExprRef):
+        ''' Record the linear constraints in assertion `e` '''
+        if z3.is_and(e):
+            for x in e.children():
+                self.add(x)
+            return
+        if not (z3.is_le(e) or z3.is_lt(e) or z3.is_ge(e) or z3.is_gt(e)
+                or (z3.is_eq(e) and z3.is_arith(e.arg(0)))):
+            return
+        lhs, rhs = self.linear(e.arg(0)), self.linear(e.arg(1))
+        if lhs is None or rhs is None:
+            return
+        # Strict inequalities are relaxed to non-strict ones, which keeps the
+        # derived bounds sound
+        if z3.is_ge(e) or z3.is_gt(e):
+            lhs, rhs = rhs, lhs
+        coeffs = dict(lhs[0])
+        for x, a in rhs[0].items():
+            coeffs[x] = coeffs.get(x, Fraction(0)) - a
+        coeffs = {x: a for x, a in coeffs.items() if a != 0}
+        term = (coeffs, lhs[1] - rhs[1])
+        eq = z3.is_eq(e)
+        self.constraints.append((term, eq))
+
+        if len(coeffs) == 1:
+            (x, a), = coeffs.items()
+            lo, hi = self.explicit.get(x, (None, None))
+            val = -term[1] / a
+            if eq or a > 0:
+                hi = val if hi is None else min(hi, val)
+            if eq or a < 0:
+                lo = val if lo is None else max(lo, val)
+            self.explicit[x] = (lo, hi)
+
+    def propagate(self) -> Dict[str, Interval]:
+        ''' The tightest intervals found for each variable '''
+        bounds: Dict[str, Interval] = {x: (None, None) for x in self.vars}
+        users: Dict[str, List[int]] = {x: [] for x in self.vars}
+        for i, ((coeffs, _), _) in enumerate(self.constraints):
+            for x in coeffs:
+                users[x].append(i)
+
+        todo = list(range(len(self.constraints)))
+        queued: Set[int] = set(todo)
+        budget = MAX_VISITS * len(self.constraints)
+        while len(todo) > 0 and budget > 0:
+            budget -= 1
+            i = todo.pop()
+            queued.remove(i)
+            (coeffs, const), eq = self.constraints[i]
+            terms = [(coeffs, const)]
+            if eq:
+                terms.append(({x: -a for x, a in coeffs.items()}, -const))
+            for (cs, k) in terms:
+                for x in self.tighten(cs, k, bounds):
+                    for j in users[x]:
+                        if j not in queued:
+                            queued.add(j)
+                            todo.append(j)
+        return bounds
+
+    @staticmethod
+    def tighten(coeffs: Dict[str, Fraction], const: Fraction,
+                bounds: Dict[str, Interval]) -> List[str]:
+        ''' Tighten `bounds` using `sum(coeffs[x] * x) + const <= 0`. Returns
+        the variables whose bounds changed '''
+        # Minimum of each term and how many terms are unbounded below
+        mins: Dict[str, Optional[Fraction]] = {}
+        total = const
+        n_unbounded = 0
+        for x, a in coeffs.items():
+            lo, hi = bounds[x]
+            m = a * lo if a > 0 and lo is not None else \
+                a * hi if a < 0 and hi is not None else None
+            mins[x] = m
+            if m is None:
+                n_unbounded += 1
+            else:
+                total += m
+        if n_unbounded > 1:
+            return []
+
+        changed = []
+        for x, a in coeffs.items():
+            if mins[x] is None:
+                rest = total
+            elif n_unbounded == 0:
+                rest = total - mins[x]
+            else:
+                continue
+            # a * x <= -rest
+            val = -rest / a
+            lo, hi = bounds[x]
+            if a > 0 and (hi is None or val < hi):
+                bounds[x] = (lo, val)
+                changed.append(x)
+            elif a < 0 and (lo is None or val > lo):
+                bounds[x] = (val, hi)
+                changed.append(x)
+        return changed
+
+
+def derive_bounds(s: MySolver) -> Tuple[Dict[str, Interval],
+                                        Dict[str, z3.ArithRef],
+                                        Dict[str, Interval]]:
+    ''' Derived intervals, the variables they are for, and the bounds the
+    constraints in `s` state directly '''
+    bp = BoundPropagator()
+    for a in s.assertions():
+        bp.add(a)
+    return (bp.propagate(), bp.vars, bp.explicit)
+
+
+def add_bounds(c: ModelConfig, s: MySolver, v: Variables) -> int:
+    ''' Assert the derived bounds that are tighter than the explicit ones.
+    Returns how many were added '''
+    bounds, vars, explicit = derive_bounds(s)
+    added = 0
+    for x, (lo, hi) in sorted(bounds.items()):
+        elo, ehi = explicit.get(x, (None, None))
+        if lo is not None and (elo is None or lo > elo):
+            s.add(vars[x] >= z3.RealVal(str(lo)))
+            added += 1
+        if hi is not None and (ehi is None or hi < ehi):
+            s.add(vars[x] <= z3.RealVal(str(hi)))
+            added += 1
+    return added
@@ -0,0 +1,397 @@
+''' Runs Z3 queries and caches the results in the `cached/` folder.
+
+Results are keyed by a hash of the query's SMT-LIB2 text and the ModelConfig
+it was built from, so re-running an identical query (e.g. a proof lemma in a
+nightly job) loads the stored QueryResult instead of solving it again. The
+folder is kept under `MAX_CACHE_BYTES` by evicting the least recently used
+files.
+
+Solve times for the same query can vary by orders of magnitude with Z3's random
+seed and arithmetic solver. `run_query(..., portfolio=n)` races n differently
+configured Z3 processes on the query and keeps the first definitive answer.
+`run_query(..., max_memory=...)` runs Z3 in a child process with memory and
+wall-clock limits, so a runaway query cannot take down a whole sweep. '''
+
+import hashlib
+import multiprocessing as mp
+from multiprocessing.connection import Connection, wait
+import os
+import pickle as pkl
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import z3
+
+from config import ModelConfig
+from pyz3_utils import MySolver
+from utils import ModelDict, model_to_dict
+from variables import VariableNames, Variables
+
+# Folder where results are stored. It must exist (see README)
+CACHE_DIR = "cached"
+# Evict least recently used results once the folder grows beyond this
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+# When solving in child processes: how often (in seconds) to check their
+# memory usage, and how long past the timeout to wait before killing them
+POLL_INTERVAL = 0.5
+KILL_GRACE = 5
+# Exit code of a Z3 process that ran out of memory where it could not raise
+# an exception (ERR_MEMOUT in Z3's source)
+Z3_MEMOUT_EXIT_CODE = 101
+
+
+class SolverConfig:
+    ''' One configuration of Z3 used in portfolio solving '''
+    def __init__(self, name: str, params: Dict[str, Any],
+                 tactic: Optional[List[str]] = None):
+        self.name = name
+        # Passed to Solver.set
+        self.params = params
+        # If given, the solver is built from these tactics combined with Then
+        self.tactic = tactic
+
+    def make_solver(self) -> z3.Solver:
+        if self.tactic is None:
+            s = z3.Solver()
+        else:
+            s = z3.Then(*self.tactic).solver()
+        for k, v in self.params.items():
+            s.set(k, v)
+        return s
+
+
+# Configurations raced in portfolio mode. `run_query(..., portfolio=n)` uses
+# the first n
+PORTFOLIO = [
+    SolverConfig("default", {}),
+    SolverConfig("seed1", {"random_seed": 1}),
+    SolverConfig("arith2_seed2", {"random_seed": 2, "smt.arith.solver": 2}),
+    SolverConfig("arith6_seed3", {"random_seed": 3, "smt.arith.solver": 6}),
+    SolverConfig("solve_eqs_seed4", {"random_seed": 4},
+                 ["simplify", "solve-eqs", "smt"]),
+    SolverConfig("seed5", {"random_seed": 5}),
+    SolverConfig("arith2_seed6", {"random_seed": 6, "smt.arith.solver": 2}),
+    SolverConfig("arith6_seed7", {"random_seed": 7, "smt.arith.solver": 6}),
+]
+
+
+class QueryResult:
+    # One of "sat", "unsat" or "unknown"
+    satisfiable: str
+    # Satisfying assignment. Only present if satisfiable == "sat"
+    model: Optional[ModelDict]
+    cfg: ModelConfig
+    # Names of the variables in `model`, with the same structure as Variables
+    v: VariableNames
+    # Timeout (in seconds) the query was run with
+    timeout: float
+    # Time (in seconds) Z3 took to produce the result
+    solve_time: float
+    # Name of the SolverConfig that produced the result in portfolio mode.
+    # None if the query was solved directly
+    solver_config: Optional[str]
+    # If unknown and Z3 ran in a child process, why: "memory", "timeout" or
+    # Z3's own reason
+    reason: Optional[str]
+
+    def __init__(self, satisfiable: str, model: Optional[ModelDict],
+                 cfg: ModelConfig, v: VariableNames, timeout: float,
+                 solve_time: float, solver_config: Optional[str] = None,
+                 reason: Optional[str] = None):
+        self.satisfiable = satisfiable
+        self.model = model
+        self.cfg = cfg
+        self.v = v
+        self.timeout = timeout
+        self.solve_time = solve_time
+        self.solver_config = solver_config
+        self.reason = reason
+
+
+class CacheStats:
+    ''' Number of cache hits and misses in this process '''
+    hits: int = 0
+    misses: int = 0
+
+    def __str__(self) -> str:
+        return f"Cache hits: {self.hits}, misses: {self.misses}"
+
+
+stats = CacheStats()
+
+
+def cfg_key(c: ModelConfig) -> str:
+    ''' Canonical string for the config fields that affect a query's result.
+    Note, ModelConfig.__init__ stores `locals()`, so we skip `self` '''
+    items = sorted((k, str(v)) for k, v in c.__dict__.items() if k != "self")
+    return repr(items)
+
+
+def canonical_smt2(s: MySolver) -> str:
+    ''' SMT-LIB2 text of the query without comments, status annotations and
+    formatting differences, so equivalent queries hash identically '''
+    lines = []
+    for line in s.to_smt2().splitlines():
+        line = line.strip()
+        if line == "" or line.startswith(";")\
+           or line.startswith("(set-info :status"):
+            continue
+        lines.append(" ".join(line.split()))
+    return "\n".join(lines)
+
+
+def query_hash(c: ModelConfig, s: MySolver) -> str:
+    h = hashlib.sha256()
+    h.update(canonical_smt2(s).encode("utf-8"))
+    h.update(cfg_key(c).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def cache_file(c: ModelConfig, s: MySolver) -> str:
+    return os.path.join(CACHE_DIR, f"{query_hash(c, s)}.cached")
+
+
+def load(fname: str) -> Optional[QueryResult]:
+    ''' Load a cached result and mark it as recently used. Returns None if
+    the file does not exist or cannot be read '''
+    try:
+        with open(fname, "rb") as f:
+            qres: QueryResult = pkl.load(f)
+    except (OSError, EOFError, pkl.UnpicklingError, AttributeError) as e:
+        if os.path.exists(fname):
+            print(f"Ignoring unreadable cache file {fname}: {e}")
+        return None
+    # The modification time doubles as the last-use time for LRU eviction
+    os.utime(fname)
+    return qres
+
+
+def lookup(c: ModelConfig, s: MySolver,
+           timeout: float) -> Tuple[str, Optional[QueryResult]]:
+    '''The cache file for the query, and the cached result if it can be
+    used instead of solving with `timeout` (see run_query). Counts the hit or
+    miss in `stats`
+
+    '''
+    fname = cache_file(c, s)
+    qres = load(fname)
+    if qres is not None and (qres.satisfiable != "unknown"
+                             or qres.timeout >= timeout):
+        stats.hits += 1
+        print(f"Using cached result {fname}")
+        return (fname, qres)
+    stats.misses += 1
+    return (fname, None)
+
+
+def store(fname: str, qres: QueryResult):
+    ''' Cache a result, unless it ran out of memory (see run_query) '''
+    if qres.reason == "memory":
+        return
+    # Write to a temporary file first so concurrent readers never see a
+    # partially written result
+    tmp = f"{fname}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        pkl.dump(qres, f)
+    os.replace(tmp, fname)
+    evict(MAX_CACHE_BYTES)
+
+
+def evict(max_bytes: int):
+    ''' Delete least recently used results until the cache folder is at most
+    `max_bytes` large '''
+    files: List[Tuple[float, int, str]] = []
+    total = 0
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith(".cached"):
+            continue
+        fname = os.path.join(CACHE_DIR, name)
+        try:
+            st = os.stat(fname)
+        except FileNotFoundError:
+            continue
+        files.append((st.st_mtime, st.st_size, fname))
+        total += st.st_size
+
+    files.sort()
+    for _, size, fname in files:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(fname)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def child_worker(smt2: str, sc: SolverConfig, timeout: float,
+                 max_memory: Optional[float], conn: Connection):
+    ''' Runs in a child process. Sends back the result, the model if sat and
+    Z3's reason if unknown '''
+    if max_memory is not None:
+        # Lets Z3 give up gracefully before the parent has to kill us
+        z3.set_param("memory_max_size", max(1, int(max_memory / 1024 ** 2)))
+    model, reason = None, None
+    try:
+        s = sc.make_solver()
+        s.set(timeout=int(timeout * 1000))
+        s.from_string(smt2)
+        satisfiable = str(s.check())
+        if satisfiable == "sat":
+            model = model_to_dict(s.model())
+        elif satisfiable == "unknown":
+            reason = s.reason_unknown()
+    except z3.Z3Exception as e:
+        # E.g. "out of memory" while parsing the query
+        satisfiable, reason = "unknown", str(e)
+    conn.send((satisfiable, model, reason))
+    conn.close()
+
+
+def rss(pid: int) -> int:
+    ''' Resident set size of a process in bytes (0 if unavailable) '''
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def unknown_reason(reason: Optional[str]) -> Optional[str]:
+    ''' Map Z3's reason_unknown to "memory" or "timeout" where possible '''
+    if reason is None:
+        return None
+    if "memory" in reason:
+        return "memory"
+    if "timeout" in reason or "canceled" in reason:
+        return "timeout"
+    return reason
+
+
+def solve_in_children(s: MySolver, configs: List[SolverConfig],
+                      timeout: float, max_memory: Optional[float])\
+        -> Tuple[str, Optional[ModelDict], Optional[str], Optional[str]]:
+    '''Run each of `configs` on the query in its own child process. Returns
+    the first sat/unsat answer and the name of the config that produced it,
+    and kills the rest. A child is killed if its RSS exceeds `max_memory`
+    bytes or if it overruns `timeout` by more than KILL_GRACE seconds. If no
+    child answers, returns "unknown" with the reason ("memory" or "timeout")
+
+    '''
+    smt2 = s.to_smt2()
+    running: Dict[Connection, Tuple[SolverConfig, mp.Process]] = {}
+    reasons: List[Optional[str]] = []
+    start = time.time()
+    try:
+        for sc in configs:
+            recv_conn, send_conn = mp.Pipe(duplex=False)
+            proc = mp.Process(target=child_worker,
+                              args=(smt2, sc, timeout, max_memory, send_conn))
+            proc.start()
+            send_conn.close()
+            running[recv_conn] = (sc, proc)
+
+        while len(running) > 0:
+            for conn in wait(list(running.keys()), timeout=POLL_INTERVAL):
+                sc, proc = running.pop(conn)
+                try:
+                    satisfiable, model, reason = conn.recv()
+                except EOFError:
+                    # The child died without answering. If it was SIGKILLed,
+                    # it was most likely by the kernel's OOM killer
+                    satisfiable, model = "unknown", None
+                    proc.join()
+                    if proc.exitcode in [-9, Z3_MEMOUT_EXIT_CODE]:
+                        reason = "memory"
+                    else:
+                        reason = f"crashed with exit code {proc.exitcode}"
+                conn.close()
+                proc.join()
+                if satisfiable != "unknown":
+                    return (satisfiable, model, sc.name, None)
+                reasons.append(unknown_reason(reason))
+
+            # Enforce the hard limits on the children that are still running
+            for conn, (sc, proc) in list(running.items()):
+                if max_memory is not None and rss(proc.pid) > max_memory:
+                    reasons.append("memory")
+                elif time.time() - start > timeout + KILL_GRACE:
+                    reasons.append("timeout")
+                else:
+                    continue
+                print(f"Killing solver {sc.name}: {reasons[-1]} limit "
+                      "exceeded")
+                proc.kill()
+                proc.join()
+                conn.close()
+                del running[conn]
+
+        if "memory" in reasons:
+            return ("unknown", None, None, "memory")
+        return ("unknown", None, None, reasons[0] if reasons else None)
+    finally:
+        for conn, (_, proc) in running.items():
+            proc.kill()
+            proc.join()
+            conn.close()
+
+
+def solve(c: ModelConfig, s: MySolver, v: Variables, timeout: float,
+          portfolio: Optional[int] = None, isolate: bool = False,
+          max_memory: Optional[float] = None) -> QueryResult:
+    ''' Run Z3 on the query without consulting the cache. See run_query for
+    the arguments '''
+    solver_config, reason = None, None
+    start = time.time()
+    if portfolio is None and not isolate and max_memory is None:
+        s.set(timeout=int(timeout * 1000))
+        satisfiable = str(s.check())
+        model = None
+        if satisfiable == "sat":
+            model = model_to_dict(s.model())
+    elif portfolio is None:
+        satisfiable, model, _, reason = solve_in_children(
+            s, PORTFOLIO[:1], timeout, max_memory)
+    else:
+        assert(1 <= portfolio <= len(PORTFOLIO))
+        satisfiable, model, solver_config, reason = solve_in_children(
+            s, PORTFOLIO[:portfolio], timeout, max_memory)
+        print(f"Portfolio winner: {solver_config}")
+    solve_time = time.time() - start
+
+    if model is not None and c.simplify:
+        # Imported here since it pulls in numpy and scipy
+        from clean_output import simplify_solution
+        model = simplify_solution(c, model, s.assertions())
+    return QueryResult(satisfiable, model, c, VariableNames(v), timeout,
+                       solve_time, solver_config, reason)
+
+
+def run_query(c: ModelConfig, s: MySolver, v: Variables,
+              timeout: float = 10,
+              portfolio: Optional[int] = None,
+              isolate: bool = False,
+              max_memory: Optional[float] = None) -> QueryResult:
+    '''Run the query, using the cached result if the same query has been
+    solved before. A cached `unknown` is only reused if it was obtained with
+    at least as large a timeout.
+
+    If `portfolio` is given, the first `portfolio` configurations in
+    PORTFOLIO are raced on the query. If `isolate` is true or `max_memory`
+    (bytes of RSS) is given, Z3 runs in a child process that is killed if it
+    exceeds the memory or wall-clock limit. The result is then `unknown` with
+    QueryResult.reason set, and the caller can carry on with other queries.
+    Results that ran out of memory are not cached, so they can be retried with
+    a larger limit
+
+    '''
+    fname, qres = lookup(c, s, timeout)
+    if qres is not None:
+        return qres
+
+    print(f"Solving query. Result will be cached in {fname}")
+    qres = solve(c, s, v, timeout, portfolio, isolate, max_memory)
+    store(fname, qres)
+    return qres
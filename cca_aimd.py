@@ -1,4 +1,5 @@
-from z3 import And, Implies, Not, Or
+from typing import Dict, List
+from z3 import And, BoolRef, Implies, Not, Or
 
 from config import ModelConfig
 from pyz3_utils import MySolver
@@ -24,11 +25,25 @@ def can_incr(
                 s.add(cv.incr_f[n][t])
         return
 
+    H = c.look_back()
     for n in range(c.N):
+        # unchanged[t][k] is true iff cwnd is the same for all of [k, t].
+        # Shared across t, so it takes O(T*H) constraints. Only defined for
+        # t - H <= k < t
+        unchanged: List[Dict[int, BoolRef]] = [{} for t in range(c.T)]
+        for t in range(1, c.T):
+            for k in range(max(0, t-H), t):
+                unchanged[t][k] = s.Bool(f"aimd_unchanged_{n},{t},{k}")
+                if k == t-1:
+                    s.add(unchanged[t][k] == (v.c_f[n][t] == v.c_f[n][t-1]))
+                else:
+                    s.add(unchanged[t][k] == And(
+                        unchanged[t-1][k], v.c_f[n][t] == v.c_f[n][t-1]))
+
         for t in range(1, c.T):
             # Increase cwnd only if we have got enough acks
             incr = []
-            for dt in range(1, t):
+            for dt in range(1, min(t, H)):
                 # Note, it is possible that v.c_f[n][t-dt] == v.c_f[n][t]
                 # even though the cwnd changed in between. Hence this SMT
                 # encoding is more relaxed than reality, which is per our
@@ -36,17 +51,27 @@ def can_incr(
                 # course add appropriate checks, but that is
                 # unnecessary. This is simpler and possibly more efficient.
                 incr.append(And(
-                    And([v.c_f[n][t-ddt] == v.c_f[n][t]
-                         for ddt in range(1, dt+1)]),
+                    unchanged[t][t-dt],
                     v.c_f[n][t-dt-1] != v.c_f[n][t-dt],
                     v.S_f[n][t] - v.S_f[n][t-dt] >= v.c_f[n][t]))
-            incr.append(And(
-                And([v.c_f[n][t-ddt] == v.c_f[n][t]
-                     for ddt in range(1, t+1)]),
-                v.S_f[n][t] - v.S_f[n][0] >= v.c_f[n][t]))
+            if t <= H:
+                incr.append(And(
+                    unchanged[t][0],
+                    v.S_f[n][t] - v.S_f[n][0] >= v.c_f[n][t]))
             incr.append(And(
                 v.S_f[n][t] - v.S_f[n][t-1] >= v.c_f[n][t]))
-            s.add(cv.incr_f[n][t] == Or(*incr))
+            if t <= H:
+                s.add(cv.incr_f[n][t] == Or(*incr))
+            else:
+                # cwnd has been unchanged for at least H timesteps. Whether
+                # enough acks arrived since it last changed is beyond the
+                # horizon. Since S_f is monotone, it is only possible if
+                # enough arrived since t=0. In that case, let the solver pick
+                old = And(
+                    unchanged[t][t-H],
+                    v.S_f[n][t] - v.S_f[n][0] >= v.c_f[n][t])
+                s.add(Implies(Or(*incr), cv.incr_f[n][t]))
+                s.add(Implies(cv.incr_f[n][t], Or(*incr, old)))
 
 
 def cca_aimd(c: ModelConfig, s: MySolver, v: Variables) -> AIMDVariables:
@@ -56,12 +81,15 @@ def cca_aimd(c: ModelConfig, s: MySolver, v: Variables) -> AIMDVariables:
     # The last send sequence number at which loss was detected
     ll = [[s.Real(f"last_loss_{n},{t}") for t in range(c.T)]
           for n in range(c.N)]
-    s.add(v.dupacks == 3 * v.alpha)
+    if not v.fold_dupacks:
+        s.add(v.dupacks == 3 * v.alpha)
     for n in range(c.N):
         # TODO: make this non-deterministic?
         s.add(ll[n][0] == v.S_f[n][0])
         for t in range(c.T):
-            if c.pacing:
+            if v.fold_rate:
+                pass
+            elif c.pacing:
                 s.add(v.r_f[n][t] == v.c_f[n][t] / c.R)
             else:
                 s.add(v.r_f[n][t] == c.C * 100)
@@ -80,7 +108,7 @@ def cca_aimd(c: ModelConfig, s: MySolver, v: Variables) -> AIMDVariables:
 
                 s.add(Implies(
                     And(decrease, Not(v.timeout_f[n][t])),
-                    And(ll[n][t] == v.A_f[n][t] - v.L_f[n][t] + v.dupacks,
+                    And(ll[n][t] == v.acc_f[n][t] + v.dupacks,
                         v.c_f[n][t] == v.c_f[n][t-1] / 2)
                 ))
                 s.add(Implies(
@@ -99,6 +127,5 @@ def cca_aimd(c: ModelConfig, s: MySolver, v: Variables) -> AIMDVariables:
                 # Timeout
                 s.add(Implies(v.timeout_f[n][t],
                               And(v.c_f[n][t] == v.alpha,
-                                  ll[n][t] == v.A_f[n][t] - v.L_f[n][t]
-                                  + v.dupacks)))
+                                  ll[n][t] == v.acc_f[n][t] + v.dupacks)))
     return cv
@@ -1,6 +1,7 @@
 ''' A simplified version of BBR '''
 
-from z3 import And, If, Implies, Not
+from typing import Dict
+from z3 import And, ArithRef, BoolRef, BoolVal, If, Implies, Not, Or
 
 from config import ModelConfig
 from pyz3_utils import MySolver
@@ -8,44 +9,83 @@ from variables import Variables
 
 
 class BBRSimpleVariables:
-    def __init__(self, c: ModelConfig, s: MySolver):
-        # State increments every RTT
+    def __init__(self, c: ModelConfig, s: MySolver, cycle: int):
+        # State increments every RTT. start_state_f[n][k] is true iff flow n
+        # starts in state k at t=0. Exactly one of them is true
         self.start_state_f =\
-            [s.Int(f"bbr_start_state_{n}") for n in range(c.N)]
+            [[s.Bool(f"bbr_start_state_{n},{k}") for k in range(cycle)]
+             for n in range(c.N)]
 
 
-def cca_bbr(c: ModelConfig, s: MySolver, v: Variables):
+def cca_bbr(c: ModelConfig, s: MySolver, v: Variables) -> BBRSimpleVariables:
     # The period over which we compute rates
     P = c.R
     # Number of RTTs over which we compute the max_cwnd (=10 in the spec)
     max_R = 4
     # The number of RTTs in the BBR cycle (=8 in the spec)
     cycle = 4
-    # The state the flow starts in at t=0
-    start_state_f = [s.Int(f"bbr_start_state_{n}") for n in range(c.N)]
+    cv = BBRSimpleVariables(c, s, cycle)
+
+    def in_state(n: int, t: int, k: int) -> BoolRef:
+        ''' Whether flow n is in state k at time t '''
+        # The state is (start + t / c.R) % cycle, so this is true iff the
+        # flow started in (k - t / c.R) % cycle. If that is not an integer
+        # (when c.R does not divide t), the flow is in none of the states
+        start = (k - t / c.R) % cycle
+        if start != int(start):
+            return BoolVal(False)
+        return cv.start_state_f[n][int(start)]
 
     for n in range(c.N):
-        s.add(start_state_f[n] >= 0)
-        s.add(start_state_f[n] < cycle)
+        s.add(Or(*cv.start_state_f[n]))
+        for k1 in range(cycle):
+            for k2 in range(k1):
+                s.add(Not(And(cv.start_state_f[n][k1],
+                              cv.start_state_f[n][k2])))
+        # The rate measured over the period ending at u
+        rate = {u: (v.S_f[n][u] - v.S_f[n][u-P]) / P
+                for u in range(P, c.T - c.R)}
+        # To compute the max over the last max_R rates for every u with O(T)
+        # variables, split the rates into blocks of max_R starting at P.
+        # Every window is then a suffix of one block followed by a prefix of
+        # the next, and the prefix and suffix maxes are shared between windows
+        prefix_max: Dict[int, ArithRef] = {}
+        suffix_max: Dict[int, ArithRef] = {}
+        for u in range(P, c.T - c.R):
+            if (u - P) % max_R == 0:
+                prefix_max[u] = rate[u]
+            else:
+                prefix_max[u] = s.Real(f"bbr_prefix_max_{n},{u}")
+                s.add(prefix_max[u] == If(rate[u] > prefix_max[u-1],
+                                          rate[u], prefix_max[u-1]))
+        for u in reversed(range(P, c.T - c.R)):
+            if (u - P) % max_R == max_R - 1 or u == c.T - c.R - 1:
+                suffix_max[u] = rate[u]
+            else:
+                suffix_max[u] = s.Real(f"bbr_suffix_max_{n},{u}")
+                s.add(suffix_max[u] == If(rate[u] > suffix_max[u+1],
+                                          rate[u], suffix_max[u+1]))
+
         for t in range(c.R + P, c.T):
             # Compute the max RTT over the last max_R RTTs
-            max_rate = [s.Real(f"max_rate_{n},{t},{dt}")
-                        for dt in range(min(t-c.R-P+1, max_R))]
-            s.add(max_rate[0] == (v.S_f[n][t-c.R] - v.S_f[n][t-c.R-P]) / P)
-            for dt in range(1, len(max_rate)):
-                rate = (v.S_f[n][t-dt-c.R] - v.S_f[n][t-dt-c.R-P]) / P
-                s.add(max_rate[dt] == If(rate > max_rate[dt-1],
-                                         rate, max_rate[dt-1]))
-
-            # Convenience variable for plotting
-            s.add(s.Real(f"max_rate_{n},{t}") == max_rate[-1])
-
-            s.add(v.c_f[n][t] == 2 * max_rate[-1] * P)
-            s_0 = (start_state_f[n] == (0 - t / c.R) % cycle)
-            s_1 = (start_state_f[n] == (1 - t / c.R) % cycle)
+            u = t - c.R
+            # The first rate in the window
+            first = u - max_R + 1
+            max_rate = s.Real(f"max_rate_{n},{t}")
+            if first <= P or (first - P) % max_R == 0:
+                # The window is a prefix of a block
+                s.add(max_rate == prefix_max[u])
+            else:
+                s.add(max_rate == If(suffix_max[first] > prefix_max[u],
+                                     suffix_max[first], prefix_max[u]))
+
+            s.add(v.c_f[n][t] == 2 * max_rate * P)
+            s_0 = in_state(n, t, 0)
+            s_1 = in_state(n, t, 1)
             s.add(Implies(s_0,
-                          v.r_f[n][t] == 1.25 * max_rate[-1]))
+                          v.r_f[n][t] == 1.25 * max_rate))
             s.add(Implies(s_1,
-                          v.r_f[n][t] == 0.8 * max_rate[-1]))
+                          v.r_f[n][t] == 0.8 * max_rate))
             s.add(Implies(And(Not(s_0), Not(s_1)),
-                          v.r_f[n][t] == 1 * max_rate[-1]))
+                          v.r_f[n][t] == 1 * max_rate))
+    return cv
@@ -10,35 +10,62 @@ def cca_copa(c: ModelConfig, s: MySolver, v: Variables):
         for t in range(c.T):
             # Basic constraints
             s.add(v.c_f[n][t] > 0)
-            s.add(v.r_f[n][t] == v.c_f[n][t] / c.R)
+            if not v.fold_rate:
+                s.add(v.r_f[n][t] == v.c_f[n][t] / c.R)
 
             if t - c.R - c.D < 0:
                 continue
 
+            H = c.look_back()
+            # The ack that arrives at t was served at t-R. Because of jitter,
+            # Copa may perceive its delay as up to D timesteps smaller, or it
+            # may perceive the delay of bytes served at any of the D
+            # timesteps before that. qdel[u][dt] is False for dt > u, so only
+            # smaller lags are considered
+            window = list(range(t-c.R-c.D, t-c.R))
             incr_alloweds, decr_alloweds = [], []
-            for dt in range(t+1):
-                # Whether we are allowd to increase/decrease
+            for dt in range(min(t-c.R+1, H)):
+                # Whether we are allowed to increase
                 incr_allowed = s.Bool("incr_allowed_%d,%d,%d" % (n, t, dt))
-                decr_allowed = s.Bool("decr_allowed_%d,%d,%d" % (n, t, dt))
-                # Warning: Adversary here is too powerful if D > 1. Add
-                # a constraint for every point between t-1 and t-1-D
-                assert(c.D == 1)
+                perceived = max(0, dt-c.D)
                 s.add(incr_allowed
                       == And(
                           v.qdel[t-c.R][dt],
                           v.S[t-c.R] > v.S[t-c.R-1],
-                          v.c_f[n][t-1] * max(0, dt-1)
-                          <= v.alpha*(c.R+max(0, dt-1))))
+                          v.c_f[n][t-1] * perceived
+                          <= v.alpha*(c.R+perceived)))
+                incr_alloweds.append(incr_allowed)
+            for dt in range(min(t-c.R, H)):
+                # Whether we are allowed to decrease. One term per timestep
+                # in the window, so the size is linear in D
+                decr_allowed = s.Bool("decr_allowed_%d,%d,%d" % (n, t, dt))
                 s.add(decr_allowed
                       == And(
-                          v.qdel[t-c.R-c.D][dt],
+                          Or([v.qdel[u][dt] for u in window if dt <= u]),
                           v.S[t-c.R] > v.S[t-c.R-1],
                           v.c_f[n][t-1] * dt >= v.alpha * (c.R + dt)))
-                incr_alloweds.append(incr_allowed)
                 decr_alloweds.append(decr_allowed)
+            if H < c.T:
+                # Delays of dt >= H. Use the most permissive of the above
+                # conditions over these dt, so the adversary is at least as
+                # powerful as without a horizon. For incr that is dt = H, and
+                # for decr it is the largest possible dt, i.e. u
+                if t - c.R >= H:
+                    perceived = max(0, H-c.D)
+                    incr_alloweds.append(And(
+                        v.qdel_old[t-c.R],
+                        v.S[t-c.R] > v.S[t-c.R-1],
+                        v.c_f[n][t-1] * perceived
+                        <= v.alpha*(c.R+perceived)))
+                for u in window:
+                    if u >= H:
+                        decr_alloweds.append(And(
+                            v.qdel_old[u],
+                            v.S[t-c.R] > v.S[t-c.R-1],
+                            v.c_f[n][t-1] * u >= v.alpha * (c.R + u)))
             # If inp is high at the beginning, qdel can be arbitrarily
             # large
-            decr_alloweds.append(v.S[t-c.R] < v.A[0] - v.L[0])
+            decr_alloweds.append(v.S[t-c.R] < v.acc[0])
 
             incr_allowed = Or(*incr_alloweds)
             decr_allowed = Or(*decr_alloweds)
@@ -37,6 +37,34 @@ class ModelConfig:
     # Whether AIMD can additively increase irrespective of losses. If true, the
     # the algorithm is more like cubic and has interesting failure modes
     aimd_incr_irrespective: bool
+    # How loss detection by dupacks is encoded. "quadratic" has O(N*T^2)
+    # constraints. "linear" has O(N*T) constraints and the same semantics, but
+    # uses an integer index and uninterpreted functions, which clean_output
+    # does not support
+    loss_encoding: str
+    # How queueing delay is encoded when calculate_qdel is on. "bool" uses a
+    # TxT matrix of Booleans. "int" uses one Int per timestep holding the
+    # delay, so the number of variables is linear in T
+    qdel_encoding: str
+    # If given, look-backs over past timesteps (loss detection, queueing
+    # delay, Copa and AIMD) only consider the last `horizon` timesteps
+    # exactly. Everything older is covered by a coarser "older than horizon"
+    # case that allows a superset of the behaviors, so unsat results remain
+    # sound. Makes the model size O(T * horizon) instead of O(T^2)
+    horizon: Optional[int]
+    # Whether to replace variables that the CCA pins to a known term (e.g.
+    # cwnd = alpha for the const CCA, rate = cwnd / R, dupacks = 3 * alpha for
+    # AIMD) with the term itself, instead of adding an equality. Such
+    # variables then do not appear in the model, which clean_output does not
+    # support
+    fold_constants: bool
+    # Whether to add implied invariants of the model (see invariants.py) as
+    # redundant constraints. They are proven once per config shape and cached
+    invariants: bool
+    # Whether to derive constant bounds for the variables by propagating
+    # intervals through the linear constraints, and assert them explicitly
+    # (see bounds.py). Only worth it for large T; it slows down small queries
+    bound_propagation: bool
 
     # These config variables are calculated automatically
     calculate_qdel: bool
@@ -57,10 +85,23 @@ class ModelConfig:
                  epsilon: str,
                  unsat_core: bool,
                  simplify: bool,
-                 aimd_incr_irrespective: bool = False):
+                 aimd_incr_irrespective: bool = False,
+                 loss_encoding: str = "quadratic",
+                 qdel_encoding: str = "bool",
+                 horizon: Optional[int] = None,
+                 fold_constants: bool = False,
+                 invariants: bool = False,
+                 bound_propagation: bool = False):
         self.__dict__ = locals()
         self.calculate_qdel = cca in ["copa"] or N > 1
 
+    def look_back(self) -> int:
+        ''' Number of past timesteps that look-backs consider exactly '''
+        if self.horizon is None:
+            return self.T
+        assert(self.horizon >= 1)
+        return min(self.horizon, self.T)
+
     @staticmethod
     def get_argparse() -> argparse.ArgumentParser:
         parser = argparse.ArgumentParser(add_help=False)
@@ -91,6 +132,20 @@ class ModelConfig:
         parser.add_argument("--unsat-core", action="store_true")
         parser.add_argument("--simplify", action="store_true")
         parser.add_argument("--aimd-incr-irrespective", action="store_true")
+        parser.add_argument(
+            "--loss-encoding",
+            type=str,
+            default="quadratic",
+            choices=["quadratic", "linear"])
+        parser.add_argument(
+            "--qdel-encoding",
+            type=str,
+            default="bool",
+            choices=["bool", "int"])
+        parser.add_argument("--horizon", type=int, default=None)
+        parser.add_argument("--fold-constants", action="store_true")
+        parser.add_argument("--invariants", action="store_true")
+        parser.add_argument("--bound-propagation", action="store_true")
 
         return parser
 
@@ -99,7 +154,10 @@ class ModelConfig:
         return cls(args.num_flows, args.D, args.rtt, args.time, args.rate,
                    args.buf_min, args.buf_max, args.dupacks, args.cca,
                    not args.no_compose, args.alpha, args.pacing, args.epsilon,
-                   args.unsat_core, args.simplify, args.aimd_incr_irrespective)
+                   args.unsat_core, args.simplify, args.aimd_incr_irrespective,
+                   args.loss_encoding, args.qdel_encoding, args.horizon,
+                   args.fold_constants, args.invariants,
+                   args.bound_propagation)
 
     @classmethod
     def default(cls):
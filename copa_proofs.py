@@ -1,13 +1,15 @@
+from typing import Tuple
 from z3 import And, Or
 
 from config import ModelConfig
+from lemmas import Lemma, run_lemmas
 from model import make_solver
-from pyz3_utils import run_query
+from pyz3_utils import MySolver
+from variables import Variables
 
 
-def prove_steady_state(timeout=10):
+def base_config() -> ModelConfig:
     # This analysis is for infinite buffer size
-
     c = ModelConfig.default()
     c.cca = "copa"
     # We only need compose=False to prove cwnd increases/doesn't
@@ -15,12 +17,19 @@ def prove_steady_state(timeout=10):
     # the assumption if we want)
     c.compose = True
     c.calculate_qdel = True
+    return c
+
+
+def initial_cwnd_time(c: ModelConfig) -> int:
+    ''' The last cwnd value that is chosen completely freely. We'll treat this
+    as the initial cwnd '''
+    return c.R + c.D - 1
 
-    # The last cwnd value that is chosen completely freely. We'll treat this as
-    # the initial cwnd
-    dur = c.R + c.D - 1
 
-    # If cwnd > 4 BDP + alpha, cwnd wil decrease by at-least alpha
+def cwnd_decreases() -> Tuple[ModelConfig, MySolver, Variables]:
+    ''' If cwnd > 4 BDP + alpha, cwnd wil decrease by at-least alpha '''
+    c = base_config()
+    dur = initial_cwnd_time(c)
     s, v = make_solver(c)
     # Lemma's assumption
     # We are looking at infinite buffer, no loss case here and in the paper
@@ -29,13 +38,16 @@ def prove_steady_state(timeout=10):
     s.add(v.c_f[0][dur] > 4*c.C*c.R + v.alpha)
     # Lemma's statement's converse
     s.add(v.c_f[0][-1] >= v.c_f[0][dur] - v.alpha)
-    print("Proving that cwnd will decrease when it is too big")
-    qres = run_query(c, s, v, timeout)
-    print(qres.satisfiable)
-    assert(qres.satisfiable == "unsat")
+    return (c, s, v)
 
-    # If queue length is > 4 BDP + 2 alpha and cwnd < 4 BDP + alpha, queue
-    # length decreases by at-least alpha and cwnd will not increase its bound
+
+def queue_decreases() -> Tuple[ModelConfig, MySolver, Variables]:
+    '''If queue length is > 4 BDP + 2 alpha and cwnd < 4 BDP + alpha, queue
+    length decreases by at-least alpha and cwnd will not increase its bound
+
+    '''
+    c = base_config()
+    dur = initial_cwnd_time(c)
     s, v = make_solver(c)
     # Lemma's assumption
     s.add(And(v.L[0] == 0, v.L[-1] == 0))
@@ -46,16 +58,18 @@ def prove_steady_state(timeout=10):
     s.add(Or(
         v.A[-1] - v.S[-1] > v.A[0] - v.S[0] - v.alpha,
         v.c_f[0][-1] > 4*c.C*c.R + v.alpha))
-    print("Proving that if queue is too big and cwnd is small enough, then "
-          "queue will fall")
-    qres = run_query(c, s, v, timeout)
-    print(qres.satisfiable)
-    assert(qres.satisfiable == "unsat")
-
-    # If cwnd < BDP - alpha and queue length < 4 BDP + 2 alpha, cwnd increases
-    # by at-least alpha and queue length does not increase its bound
+    return (c, s, v)
+
+
+def cwnd_increases() -> Tuple[ModelConfig, MySolver, Variables]:
+    '''If cwnd < BDP - alpha and queue length < 4 BDP + 2 alpha, cwnd increases
+    by at-least alpha and queue length does not increase its bound
+
+    '''
+    c = base_config()
     c.T = 15
     c.compose = False  # we definitely need it to prove cwnd increases
+    dur = initial_cwnd_time(c)
     s, v = make_solver(c)
     # Lemma's assumption
     s.add(And(v.L[0] == 0, v.L[-1] == 0))
@@ -68,15 +82,15 @@ def prove_steady_state(timeout=10):
             v.c_f[0][-1] < c.C*c.R - v.alpha,
             v.c_f[0][-1] < v.c_f[0][dur] + v.alpha),
         v.A[-1] - v.S[-1] > 4*c.C*c.R + 2*v.alpha))
-    print("Proving that if cwnd is too small and the queue is small enough, "
-          "cwnd increases")
-    qres = run_query(c, s, v, timeout)
-    print(qres.satisfiable)
-    assert(qres.satisfiable == "unsat")
+    return (c, s, v)
 
-    # If Copa has entered steady state, it does not leave it
+
+def steady_state_stays() -> Tuple[ModelConfig, MySolver, Variables]:
+    ''' If Copa has entered steady state, it does not leave it '''
+    c = base_config()
     c.T = 10
     c.compose = False
+    dur = initial_cwnd_time(c)
     s, v = make_solver(c)
     ors = []
     # Lemma's assumption
@@ -90,11 +104,23 @@ def prove_steady_state(timeout=10):
     ors.append(v.c_f[0][-1] < c.C*c.R - v.alpha)
     ors.append(v.A[-1] - v.S[-1] > 4*c.C*c.R + 2*v.alpha)
     s.add(Or(*ors))
-    print("Proving that if Copa has entered steady state, it will "
-          "remain there")
-    qres = run_query(c, s, v, timeout)
-    print(qres.satisfiable)
-    assert(qres.satisfiable == "unsat")
+    return (c, s, v)
+
+
+def prove_steady_state(timeout=10):
+    ''' The lemmas are independent, so they are checked in parallel '''
+    lemmas = [
+        Lemma("cwnd will decrease when it is too big", cwnd_decreases),
+        Lemma("If queue is too big and cwnd is small enough, then queue will "
+              "fall", queue_decreases),
+        Lemma("If cwnd is too small and the queue is small enough, cwnd "
+              "increases", cwnd_increases),
+        Lemma("If Copa has entered steady state, it will remain there",
+              steady_state_stays)]
+
+    report = run_lemmas(lemmas, timeout)
+    print(report)
+    assert(report.proved())
 
 
 if __name__ == "__main__":
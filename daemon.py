@@ -0,0 +1,209 @@
+''' A local daemon that answers queries from warm worker processes.
+
+Every query script otherwise pays for Python startup, importing z3 (and
+numpy/scipy/matplotlib), and building the base model with `make_solver` before
+Z3 even starts. The daemon keeps worker processes with z3 imported, and each
+worker caches the base models it has built, keyed by ModelConfig. A query
+consists of a ModelConfig and extra constraints given as an SMT-LIB2 fragment
+over the model's variable names, e.g.
+
+    (assert (< (- tot_service_9 tot_service_0) 1.0))
+
+Start the daemon with `python3 daemon.py --workers 4` and send queries with
+`daemon.query`. The workers share one Unix socket and the kernel hands each
+connection to an idle worker.
+
+Requests are pickled, so only clients that know the daemon's secret key are
+served. `serve` writes a fresh key to `<address>.key` (mode 0600) and `query`
+reads it from there. The default socket lives in a directory that only the
+current user can access. '''
+
+import argparse
+from collections import OrderedDict
+from multiprocessing import AuthenticationError, Process
+from multiprocessing.connection import Client, Connection, Listener
+import os
+import signal
+import sys
+import tempfile
+import time
+import traceback
+from typing import Optional, Tuple
+import z3
+
+from cache import QueryResult, cfg_key
+from config import ModelConfig
+from model import make_solver
+from utils import collect_consts, model_to_dict
+from variables import VariableNames
+
+# Bytes in the key that clients must know
+AUTHKEY_BYTES = 32
+# Number of base models each worker keeps. Least recently used ones are
+# dropped beyond this
+MAX_BASE_MODELS = 8
+
+
+def default_address() -> str:
+    ''' Socket in a directory only the current user can access. Raises
+    RuntimeError if someone else owns the directory or can access it '''
+    base = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    folder = os.path.join(base, f"ccac-{os.getuid()}")
+    os.makedirs(folder, mode=0o700, exist_ok=True)
+    st = os.stat(folder)
+    if st.st_uid != os.getuid() or st.st_mode & 0o077 != 0:
+        raise RuntimeError(f"{folder} must be owned by the current user and "
+                           "not accessible to others")
+    return os.path.join(folder, "daemon.sock")
+
+
+def key_file(address: str) -> str:
+    return f"{address}.key"
+
+
+def write_authkey(address: str) -> bytes:
+    ''' Generate a new key and write it where `query` will look for it '''
+    key = os.urandom(AUTHKEY_BYTES)
+    fname = key_file(address)
+    if os.path.exists(fname):
+        os.remove(fname)
+    # Create the file with its final permissions, so the key is never
+    # readable by others
+    fd = os.open(fname, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+def read_authkey(address: str) -> bytes:
+    with open(key_file(address), "rb") as f:
+        return f.read()
+
+
+class BaseModel:
+    ''' A model built by make_solver, kept in a worker between queries '''
+    def __init__(self, c: ModelConfig):
+        s, v = make_solver(c)
+        self.c = c
+        self.v = VariableNames(v)
+        self.solver = z3.Solver()
+        self.solver.add(s.assertions())
+        # Used to resolve variable names in the SMT2 fragments
+        self.decls = collect_consts(list(self.solver.assertions()))
+
+    def query(self, constraints: str, timeout: float) -> QueryResult:
+        extra = z3.parse_smt2_string(constraints, decls=self.decls)
+        self.solver.push()
+        try:
+            self.solver.add(extra)
+            self.solver.set(timeout=int(timeout * 1000))
+            start = time.time()
+            satisfiable = str(self.solver.check())
+            solve_time = time.time() - start
+            model = None
+            if satisfiable == "sat":
+                model = model_to_dict(self.solver.model())
+                if self.c.simplify:
+                    # Imported here since it pulls in numpy and scipy
+                    from clean_output import simplify_solution
+                    model = simplify_solution(self.c, model,
+                                              self.solver.assertions())
+        finally:
+            self.solver.pop()
+        return QueryResult(satisfiable, model, self.c, self.v, timeout,
+                           solve_time)
+
+
+def handle(bases: "OrderedDict[str, BaseModel]",
+           req: Tuple[ModelConfig, str, float]) -> QueryResult:
+    c, constraints, timeout = req
+    key = cfg_key(c)
+    if key in bases:
+        bases.move_to_end(key)
+    else:
+        bases[key] = BaseModel(c)
+        if len(bases) > MAX_BASE_MODELS:
+            bases.popitem(last=False)
+    return bases[key].query(constraints, timeout)
+
+
+def worker(listener: Listener):
+    bases: "OrderedDict[str, BaseModel]" = OrderedDict()
+    while True:
+        try:
+            conn = listener.accept()
+        except (AuthenticationError, EOFError, OSError):
+            # A client without the key, or one that went away during the
+            # handshake. Nothing was unpickled
+            continue
+        try:
+            req = conn.recv()
+            try:
+                conn.send(("ok", handle(bases, req)))
+            except Exception:
+                conn.send(("error", traceback.format_exc()))
+        except (EOFError, OSError):
+            # The client went away
+            pass
+        finally:
+            conn.close()
+
+
+def serve(address: Optional[str], workers: int):
+    if address is None:
+        address = default_address()
+    if os.path.exists(address):
+        os.remove(address)
+    authkey = write_authkey(address)
+    # Make sure the workers are cleaned up when we are killed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    procs = [Process(target=worker, args=(listener,))
+             for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+    print(f"Listening on {address} with {workers} workers")
+    try:
+        for proc in procs:
+            proc.join()
+    finally:
+        for proc in procs:
+            proc.terminate()
+        listener.close()
+
+
+def query(c: ModelConfig, constraints: str, timeout: float = 10,
+          address: Optional[str] = None) -> QueryResult:
+    '''Run make_solver(c) plus `constraints` (an SMT-LIB2 fragment) on the
+    daemon. Raises RuntimeError if the daemon failed to run the query
+
+    '''
+    if address is None:
+        address = default_address()
+    conn: Connection = Client(address, family="AF_UNIX",
+                              authkey=read_authkey(address))
+    try:
+        conn.send((c, constraints, timeout))
+        status, res = conn.recv()
+    finally:
+        conn.close()
+    if status != "ok":
+        raise RuntimeError(f"Daemon failed to run the query:\n{res}")
+    return res
+
+
+def to_smt2_fragment(*exprs: z3.BoolRef) -> str:
+    ''' Convert constraints to an SMT-LIB2 fragment that can be passed to
+    `query` '''
+    return "\n".join(f"(assert {e.sexpr()})" for e in exprs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve CCAC queries from "
+                                     "warm worker processes")
+    parser.add_argument("--address", type=str, default=None,
+                        help="Unix socket to listen on. Defaults to "
+                        "daemon.sock in a per-user directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    serve(args.address, args.workers)
@@ -1,10 +1,12 @@
 from z3 import And, Not, Or
 
+from cache import run_query, stats
 from config import ModelConfig
 from model import make_solver
+from optimize import optimize_bound
 from plot import plot_model
-from pyz3_utils import MySolver, run_query
 from utils import make_periodic
+from variables import VariableNames
 
 
 def bbr_low_util(timeout=10):
@@ -93,6 +95,29 @@ def copa_low_util(timeout=10):
         plot_model(qres.model, c, qres.v)
 
 
+def copa_min_util(timeout=600):
+    '''Computes the exact minimum utilization of Copa in the setting of
+    copa_low_util with a single optimization query, instead of searching for
+    it with a sequence of sat/unsat queries
+
+    '''
+    c = ModelConfig.default()
+    c.compose = False
+    c.cca = "copa"
+    c.calculate_qdel = True
+    c.T = 10
+    s, v = make_solver(c)
+    s.add(v.L[0] == v.L[-1])
+    make_periodic(c, s, v, c.R + c.D)
+
+    ores = optimize_bound(c, s, v, v.S[-1] - v.S[0], timeout=timeout)
+    print(f"Minimum bytes served: {ores}")
+    if ores.value is not None:
+        print(f"Minimum utilization: {float(ores.value / (c.C * c.T))}")
+    if ores.model is not None:
+        plot_model(ores.model, c, VariableNames(v))
+
+
 def aimd_premature_loss(timeout=60):
     '''Finds a case where AIMD bursts 2 BDP packets where buffer size = 2 BDP and
     cwnd <= 2 BDP. Here 1BDP is due to an ack burst and another BDP is because
@@ -152,7 +177,8 @@ if __name__ == "__main__":
     funcs = {
         "aimd_premature_loss": aimd_premature_loss,
         "bbr_low_util": bbr_low_util,
-        "copa_low_util": copa_low_util
+        "copa_low_util": copa_low_util,
+        "copa_min_util": copa_min_util
     }
     usage = f"Usage: python3 example_queries.py <{'|'.join(funcs.keys())}>"
 
@@ -163,6 +189,7 @@ if __name__ == "__main__":
     cmd = sys.argv[1]
     if cmd in funcs:
         funcs[cmd]()
+        print(stats)
     else:
         print("Command not recognized")
         print(usage)
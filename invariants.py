@@ -0,0 +1,180 @@
+''' Implied invariants of the network model, added to queries as lemmas.
+
+Facts such as "service never exceeds accepted bytes" follow from the
+constraints in `make_solver`, but Z3 has to rediscover them in every query.
+With `ModelConfig.invariants` set, `make_solver` adds them as redundant
+constraints, which can speed up propagation.
+
+An invariant is only added after it has been proven, i.e. after the model
+without any CCA (cca="any") and with the invariant negated is unsat. Since
+every CCA only adds constraints, the invariant then holds for all of them.
+Whether each invariant holds only depends on the config's shape (T, N,
+compose, buffers, ...), so every shape is proven once. The results are cached
+in the `cached/` folder, keyed on the text of the proof obligation, so a
+change to the model or to an invariant is never covered by a stale proof. '''
+
+from copy import copy
+import hashlib
+import os
+import time
+from typing import Callable, Dict, List
+import z3
+
+import cache
+from cache import QueryResult, load, query_hash, store
+from config import ModelConfig
+from pyz3_utils import MySolver
+from variables import Variables
+
+# Timeout (in seconds) for proving a single invariant
+PROOF_TIMEOUT = 60
+
+
+class Invariant:
+    def __init__(self, name: str,
+                 make: Callable[[ModelConfig, Variables], List[z3.BoolRef]]):
+        self.name = name
+        # Instantiates the invariant on the given variables
+        self.make = make
+
+
+def service_le_accepted(c: ModelConfig, v: Variables) -> List[z3.BoolRef]:
+    return [v.S[t] <= v.acc[t] for t in range(c.T)]
+
+
+def detected_le_lost(c: ModelConfig, v: Variables) -> List[z3.BoolRef]:
+    return [v.Ld_f[n][t] <= v.L_f[n][t]
+            for n in range(c.N) for t in range(c.T)]
+
+
+def total_monotone(c: ModelConfig, v: Variables) -> List[z3.BoolRef]:
+    return [x[t] >= x[t - 1] for x in [v.A, v.S, v.L]
+            for t in range(1, c.T)]
+
+
+def service_lower_bound(c: ModelConfig, v: Variables) -> List[z3.BoolRef]:
+    return [v.S[t] >= c.C * (t - c.D) - v.W[t] for t in range(c.T)]
+
+
+def queue_le_buf_max(c: ModelConfig, v: Variables) -> List[z3.BoolRef]:
+    if c.buf_max is None:
+        return []
+    return [v.queue[t] <= c.buf_max + c.C * c.D for t in range(c.T)]
+
+
+def loss_constant(c: ModelConfig, v: Variables) -> List[z3.BoolRef]:
+    if c.buf_min is not None:
+        return []
+    return [v.L_f[n][t] == v.L_f[n][0]
+            for n in range(c.N) for t in range(1, c.T)]
+
+
+# W is already constrained to be monotone in `monotone`, so it is not here
+INVARIANTS = [
+    Invariant("service_le_accepted", service_le_accepted),
+    Invariant("detected_le_lost", detected_le_lost),
+    Invariant("total_monotone", total_monotone),
+    Invariant("service_lower_bound", service_lower_bound),
+    Invariant("queue_le_buf_max", queue_le_buf_max),
+    Invariant("loss_constant", loss_constant),
+]
+
+
+def shape(c: ModelConfig) -> ModelConfig:
+    ''' The config the invariants are proven for. Options that only affect
+    the CCA or how the query is run are reset '''
+    cfg = copy(c)
+    cfg.cca = "any"
+    cfg.fold_constants = False
+    cfg.unsat_core = False
+    cfg.simplify = False
+    cfg.invariants = False
+    cfg.bound_propagation = False
+    return cfg
+
+
+def prove_invariants(c: ModelConfig) -> Dict[str, str]:
+    '''Z3's result ("unsat" means proven) for the negation of each invariant
+    in INVARIANTS for the shape of `c`. Each result is cached under a hash of
+    its proof obligation, i.e. the base model and the negated invariant, so
+    changes to either are proven afresh. `unknown` results are not cached and
+    are retried next time
+
+    '''
+    # model imports this module
+    from model import make_solver
+
+    cfg = shape(c)
+    ms, v = make_solver(cfg)
+    base = query_hash(cfg, ms)
+    s = z3.Solver()
+    s.set(timeout=PROOF_TIMEOUT * 1000)
+    s.add(ms.assertions())
+    res: Dict[str, str] = {}
+    for inv in INVARIANTS:
+        neg = z3.Not(z3.And(inv.make(cfg, v)))
+        key = hashlib.sha256((base + neg.sexpr()).encode("utf-8"))
+        fname = os.path.join(cache.CACHE_DIR,
+                             f"invariant_{key.hexdigest()[:16]}.cached")
+        qres = load(fname)
+        if qres is None or qres.satisfiable == "unknown":
+            s.push()
+            s.add(neg)
+            start = time.time()
+            qres = QueryResult(str(s.check()), None, cfg, None, PROOF_TIMEOUT,
+                               time.time() - start)
+            s.pop()
+            print(f"Invariant {inv.name}: "
+                  + ("proven" if qres.satisfiable == "unsat"
+                     else qres.satisfiable))
+            if qres.satisfiable != "unknown":
+                store(fname, qres)
+        res[inv.name] = qres.satisfiable
+    return res
+
+
+def add_invariants(c: ModelConfig, s: MySolver, v: Variables) -> List[str]:
+    ''' Add the proven invariants to `s`. Returns their names '''
+    res = prove_invariants(c)
+    added = []
+    for inv in INVARIANTS:
+        if res[inv.name] == "unsat":
+            for x in inv.make(c, v):
+                s.add(x)
+            added.append(inv.name)
+    return added
+
+
+def benchmark(timeout: float = 300, seeds: int = 3):
+    ''' Compare solve times of the AIMD and Copa proof lemmas with and without
+    the invariants (median over Z3 random seeds) '''
+    import aimd_proofs
+    import copa_proofs
+
+    lemmas = [("aimd.cwnd_decreases", aimd_proofs.cwnd_decreases),
+              ("aimd.undetected_decreases", aimd_proofs.undetected_decreases),
+              ("aimd.steady_state_stays", aimd_proofs.steady_state_stays),
+              ("copa.cwnd_decreases", copa_proofs.cwnd_decreases),
+              ("copa.queue_decreases", copa_proofs.queue_decreases),
+              ("copa.cwnd_increases", copa_proofs.cwnd_increases),
+              ("copa.steady_state_stays", copa_proofs.steady_state_stays)]
+    for name, build in lemmas:
+        c, s, v = build()
+        res = []
+        for inv in [False, True]:
+            if inv:
+                add_invariants(c, s, v)
+            times = []
+            for seed in range(seeds):
+                zs = z3.Solver()
+                zs.set(random_seed=seed, timeout=int(timeout * 1000))
+                zs.add(s.assertions())
+                start = time.time()
+                sat = str(zs.check())
+                times.append(time.time() - start)
+            res.append(f"{sat} {sorted(times)[seeds // 2]:7.2f}s")
+        print(f"{name:26}  without: {res[0]}  with: {res[1]}")
+
+
+if __name__ == "__main__":
+    benchmark()
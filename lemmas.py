@@ -0,0 +1,103 @@
+''' Runs independent proof lemmas in parallel worker processes.
+
+A lemma is a function that builds a query (usually with `make_solver`) whose
+unsatisfiability proves the lemma. Each lemma is built and solved in its own
+process, so the wall-clock time of a proof is that of its slowest lemma rather
+than the sum of all of them. '''
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+import time
+from typing import Callable, List, Optional, Tuple
+
+from cache import run_query, stats
+from config import ModelConfig
+from pyz3_utils import MySolver
+from variables import Variables
+
+# Builds the query for a lemma. Must be picklable (i.e. a module-level function
+# or a functools.partial of one) so it can be sent to worker processes
+LemmaBuilder = Callable[[], Tuple[ModelConfig, MySolver, Variables]]
+
+
+class Lemma:
+    def __init__(self, name: str, build: LemmaBuilder):
+        self.name = name
+        self.build = build
+
+
+class LemmaResult:
+    def __init__(self, name: str, satisfiable: str, build_time: float,
+                 solve_time: float, cached: bool):
+        self.name = name
+        # The lemma is proven iff this is "unsat"
+        self.satisfiable = satisfiable
+        # Time (in seconds) to construct the query
+        self.build_time = build_time
+        # Time (in seconds) for run_query to return. Small if it was cached
+        self.solve_time = solve_time
+        # Whether the result was loaded from the cache
+        self.cached = cached
+
+
+class LemmaReport:
+    def __init__(self, results: List[LemmaResult], wall_time: float):
+        self.results = results
+        self.wall_time = wall_time
+
+    def proved(self) -> bool:
+        ''' Whether every lemma was proven '''
+        return all(r.satisfiable == "unsat" for r in self.results)
+
+    def __str__(self) -> str:
+        width = max([len(r.name) for r in self.results] + [5])
+        lines = [f"{'Lemma':<{width}}  result   build(s)  solve(s)"]
+        for r in self.results:
+            lines.append(f"{r.name:<{width}}  {r.satisfiable:<7}  "
+                         f"{r.build_time:8.2f}  {r.solve_time:8.2f}"
+                         + ("  (cached)" if r.cached else ""))
+        lines.append(f"Wall-clock time: {self.wall_time:.2f}s")
+        if not self.proved():
+            failed = [r.name for r in self.results
+                      if r.satisfiable != "unsat"]
+            lines.append(f"Not proven: {', '.join(failed)}")
+        return "\n".join(lines)
+
+
+def run_lemma(lemma: Lemma, timeout: float) -> LemmaResult:
+    start = time.time()
+    c, s, v = lemma.build()
+    build_time = time.time() - start
+
+    print(f"Proving: {lemma.name}")
+    hits = stats.hits
+    start = time.time()
+    qres = run_query(c, s, v, timeout)
+    solve_time = time.time() - start
+    print(f"{lemma.name}: {qres.satisfiable}")
+    return LemmaResult(lemma.name, qres.satisfiable, build_time, solve_time,
+                       stats.hits > hits)
+
+
+def run_lemmas(lemmas: List[Lemma], timeout: float,
+               processes: Optional[int] = None) -> LemmaReport:
+    '''Build and check every lemma, each in its own worker process. Results in
+    the report are in the same order as `lemmas`. If processes == 1, the
+    lemmas are run one after another in this process
+
+    '''
+    if processes is None:
+        processes = min(len(lemmas), os.cpu_count() or 1)
+
+    start = time.time()
+    if processes <= 1:
+        results = [run_lemma(lemma, timeout) for lemma in lemmas]
+    else:
+        results_by_idx = {}
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = {pool.submit(run_lemma, lemma, timeout): i
+                       for i, lemma in enumerate(lemmas)}
+            for future in as_completed(futures):
+                results_by_idx[futures[future]] = future.result()
+        results = [results_by_idx[i] for i in range(len(lemmas))]
+    return LemmaReport(results, time.time() - start)
@@ -1,11 +1,15 @@
+from copy import copy
 from typing import Optional, Tuple
-from z3 import And, Sum, Implies, Or, Not, If
+from z3 import And, Function, IntSort, RealSort, Sum, Implies, Or, Not, If
 
+from bounds import add_bounds
 from cca_aimd import cca_aimd
 from cca_bbr import cca_bbr
 from cca_copa import cca_copa
 from config import ModelConfig
+from invariants import add_invariants
 from pyz3_utils import MySolver
+from utils import collect_consts
 from variables import Variables
 
 
@@ -17,8 +21,7 @@ def monotone(c: ModelConfig, s: MySolver, v: Variables):
             s.add(v.S_f[n][t] >= v.S_f[n][t - 1])
             s.add(v.L_f[n][t] >= v.L_f[n][t - 1])
 
-            s.add(
-                v.A_f[n][t] - v.L_f[n][t] >= v.A_f[n][t - 1] - v.L_f[n][t - 1])
+            s.add(v.acc_f[n][t] >= v.acc_f[n][t - 1])
         s.add(v.W[t] >= v.W[t - 1])
 
 
@@ -38,6 +41,9 @@ def initial(c: ModelConfig, s: MySolver, v: Variables):
 
 def relate_tot(c: ModelConfig, s: MySolver, v: Variables):
     ''' Relate total values to per-flow values '''
+    if c.N == 1:
+        # They are the same variables. See Variables
+        return
     for t in range(c.T):
         s.add(v.A[t] == Sum([v.A_f[n][t] for n in range(c.N)]))
         s.add(v.L[t] == Sum([v.L_f[n][t] for n in range(c.N)]))
@@ -47,11 +53,11 @@ def relate_tot(c: ModelConfig, s: MySolver, v: Variables):
 def network(c: ModelConfig, s: MySolver, v: Variables):
     for t in range(c.T):
         for n in range(c.N):
-            s.add(v.S_f[n][t] <= v.A_f[n][t] - v.L_f[n][t])
+            s.add(v.S_f[n][t] <= v.acc_f[n][t])
 
-        s.add(v.S[t] <= c.C * t - v.W[t])
+        s.add(v.S[t] <= v.bound[t])
         if t >= c.D:
-            s.add(c.C * (t - c.D) - v.W[t - c.D] <= v.S[t])
+            s.add(v.bound[t - c.D] <= v.S[t])
         else:
             # The constraint is the most slack when black line is steepest. So
             # we'll say there was no wastage when t < 0
@@ -60,21 +66,19 @@ def network(c: ModelConfig, s: MySolver, v: Variables):
         if c.compose:
             if t > 0:
                 s.add(
-                    Implies(v.W[t] > v.W[t - 1],
-                            v.A[t] - v.L[t] <= c.C * t - v.W[t]))
+                    Implies(v.W[t] > v.W[t - 1], v.acc[t] <= v.bound[t]))
         else:
             if t > 0:
                 s.add(
-                    Implies(v.W[t] > v.W[t - 1],
-                            v.A[t] - v.L[t] <= v.S[t] + v.epsilon))
+                    Implies(v.W[t] > v.W[t - 1], v.queue[t] <= v.epsilon))
 
         if c.buf_min is not None:
             if t > 0:
                 r = sum([v.r_f[n][t] for n in range(c.N)])
                 s.add(
                     Implies(
-                        v.L[t] > v.L[t - 1], v.A[t] - v.L[t] >= c.C *
-                        (t - 1) - v.W[t - 1] + c.buf_min
+                        v.L[t] > v.L[t - 1],
+                        v.acc[t] >= v.bound[t - 1] + c.buf_min
                         # And(v.A[t] - v.L[t] >= c.C*(t-1) - v.W[t-1] + c.buf_min,
                         #     r > c.C,
                         #     c.C*(t-1) - v.W[t-1] + c.buf_min
@@ -86,25 +90,76 @@ def network(c: ModelConfig, s: MySolver, v: Variables):
 
         # Enforce buf_max if given
         if c.buf_max is not None:
-            s.add(v.A[t] - v.L[t] <= c.C * t - v.W[t] + c.buf_max)
+            s.add(v.acc[t] <= v.bound[t] + c.buf_max)
 
 
-def loss_detected(c: ModelConfig, s: MySolver, v: Variables):
+def loss_detected_linear(c: ModelConfig, s: MySolver, v: Variables):
+    '''Encodes loss detection by dupacks with O(N*T) constraints. Same
+    semantics as the quadratic encoding in `loss_detected`, provided the
+    constraints in `monotone` hold.
+
+    Since A_f - L_f is monotone, the bytes sent at time u are detectable at
+    time t iff u <= k, where k is the last such time. Since L_f is monotone,
+    the quadratic encoding's constraints reduce to L_f[k] <= Ld_f[t] <=
+    L_f[k+1]. To index by k, A_f - L_f and L_f are also exposed as functions
+    of the time index.
+
+    '''
     for n in range(c.N):
+        accepted = Function(f"{v.pre}accepted_fn_{n}", IntSort(), RealSort())
+        lost = Function(f"{v.pre}losts_fn_{n}", IntSort(), RealSort())
         for t in range(c.T):
-            for dt in range(c.T):
-                if t - c.R - dt < 0:
-                    continue
-                # Loss is detectable through dupacks
-                detectable = v.A_f[n][t-c.R-dt] - v.L_f[n][t-c.R-dt]\
-                    + v.dupacks <= v.S_f[n][t-c.R]
+            s.add(accepted(t) == v.acc_f[n][t])
+            s.add(lost(t) == v.L_f[n][t])
+
+        prev_k = None
+        for t in range(c.R, c.T):
+            # The last time whose bytes are detectable at t. -1 if none
+            k = s.Int(f"{v.pre}dupack_idx_{n},{t}")
+            s.add(k >= -1)
+            s.add(k <= t - c.R)
+            s.add(Or(k == -1,
+                     accepted(k) + v.dupacks <= v.S_f[n][t - c.R]))
+            s.add(Or(k == t - c.R,
+                     accepted(k + 1) + v.dupacks > v.S_f[n][t - c.R]))
+            # Implied since S_f is monotone, but it helps the solver
+            if prev_k is not None:
+                s.add(k >= prev_k)
+            prev_k = k
+
+            s.add(Implies(And(Not(v.timeout_f[n][t]), k >= 0),
+                          v.Ld_f[n][t] >= lost(k)))
+            s.add(Implies(And(Not(v.timeout_f[n][t]), k < t - c.R),
+                          v.Ld_f[n][t] <= lost(k + 1)))
 
-                s.add(
-                    Implies(And(Not(v.timeout_f[n][t]), detectable),
-                            v.Ld_f[n][t] >= v.L_f[n][t - c.R - dt]))
-                s.add(
-                    Implies(And(Not(v.timeout_f[n][t]), Not(detectable)),
-                            v.Ld_f[n][t] <= v.L_f[n][t - c.R - dt]))
+
+def loss_detected(c: ModelConfig, s: MySolver, v: Variables):
+    if c.loss_encoding == "linear":
+        loss_detected_linear(c, s, v)
+    else:
+        assert(c.loss_encoding == "quadratic")
+
+    for n in range(c.N):
+        for t in range(c.T):
+            if c.loss_encoding == "quadratic":
+                # Bytes older than the horizon are skipped. Since A_f - L_f
+                # and L_f are monotone, their constraints are implied if the
+                # oldest bytes within the horizon are detectable. Otherwise
+                # Ld_f[t] is only bounded above by the oldest L_f within the
+                # horizon, which allows a superset of the behaviors
+                for dt in range(c.look_back()):
+                    if t - c.R - dt < 0:
+                        continue
+                    # Loss is detectable through dupacks
+                    detectable = v.acc_f[n][t-c.R-dt] + v.dupacks \
+                        <= v.S_f[n][t-c.R]
+
+                    s.add(
+                        Implies(And(Not(v.timeout_f[n][t]), detectable),
+                                v.Ld_f[n][t] >= v.L_f[n][t - c.R - dt]))
+                    s.add(
+                        Implies(And(Not(v.timeout_f[n][t]), Not(detectable)),
+                                v.Ld_f[n][t] <= v.L_f[n][t - c.R - dt]))
 
             # We implement an RTO scheme that magically triggers when S(t) ==
             # A(t) - L(t). While this is not implementable in reality, it is
@@ -127,44 +182,125 @@ def loss_detected(c: ModelConfig, s: MySolver, v: Variables):
             else:
                 s.add(v.timeout_f[n][t] == And(
                     v.S_f[n][t - c.R] < v.A_f[n][t - 1],  # oustanding bytes
-                    v.S_f[n][t - c.R] == v.A_f[n][t - c.R] -
-                    v.L_f[n][t - c.R]))
+                    v.S_f[n][t - c.R] == v.acc_f[n][t - c.R]))
             s.add(Implies(v.timeout_f[n][t], v.Ld_f[n][t] == v.L_f[n][t]))
 
             s.add(v.Ld_f[n][t] <= v.L_f[n][t - c.R])
 
 
+def calculate_qdel_int(c: ModelConfig, s: MySolver, v: Variables):
+    '''Same constraints as calculate_qdel, for qdel_encoding="int", with O(T)
+    constraints and variables. Relies on the constraints in `monotone`,
+    `relate_tot` and `network`. Under these, if S changed at t, the bytes
+    exiting at t entered at the unique t - dt with A - L just below S[t] at
+    t - dt - 1 and at least S[t] at t - dt. If S[t] <= A[0] - L[0], they
+    entered before t=0 and qdel_idx[t] = -1. A - L is exposed as a function
+    of the time index, so it can be indexed by qdel_idx.
+
+    '''
+    accepted = Function(f"{v.pre}tot_accepted_fn", IntSort(), RealSort())
+    for t in range(c.T):
+        s.add(accepted(t) == v.acc[t])
+
+    for t in range(c.T):
+        idx = v.qdel_idx[t]
+        s.add(idx >= -1)
+        if t == 0:
+            # Mirrors calculate_qdel, whose index t - 1 wraps around to T - 1
+            s.add(idx <= 0)
+            s.add((idx == 0) == And(v.S[0] == v.S[-1], v.qdel_idx[-1] == 0))
+            continue
+
+        s.add(idx <= t - 1)
+        s.add(Implies(v.S[t] == v.S[t - 1], idx == v.qdel_idx[t - 1]))
+        s.add(Implies(v.S[t] != v.S[t - 1], Or(
+            And(idx == -1, v.S[t] <= accepted(0)),
+            And(idx >= 0,
+                accepted(t - idx - 1) < v.S[t],
+                accepted(t - idx) >= v.S[t]))))
+
+        # See calculate_qdel
+        s.add(
+            Implies(And(v.S[t] != v.S[t - 1], v.acc[0] < v.S[t - 1]),
+                    idx != t - 1))
+
+
 def calculate_qdel(c: ModelConfig, s: MySolver, v: Variables):
+    if c.qdel_encoding == "int":
+        calculate_qdel_int(c, s, v)
+        return
+    assert(c.qdel_encoding == "bool")
+
+    H = c.look_back()
     # Figure out the time when the bytes being output at time t were
     # first input
     for t in range(c.T):
-        for dt in range(c.T):
+        for dt in range(H):
             if dt > t:
-                s.add(Not(v.qdel[t][dt]))
+                # qdel[t][dt] is False. See Variables
                 continue
             s.add(v.qdel[t][dt] == Or(
                 And(
                     v.S[t] != v.S[t - 1],
-                    And(v.A[t - dt - 1] - v.L[t - dt - 1] < v.S[t],
-                        v.A[t - dt] - v.L[t - dt] >= v.S[t])),
+                    And(v.acc[t - dt - 1] < v.S[t],
+                        v.acc[t - dt] >= v.S[t])),
                 And(v.S[t] == v.S[t - 1], v.qdel[t - 1][dt])))
 
+        if H < c.T:
+            # Whether the bytes were input at t - dt for some dt >= H. Since
+            # A - L is monotone, that is the case iff they were input after
+            # t=0 and no later than t - H. For t <= H it is False. See
+            # Variables
+            if t > H:
+                s.add(v.qdel_old[t] == Or(
+                    And(v.S[t] != v.S[t - 1],
+                        v.acc[0] < v.S[t],
+                        v.acc[t - H] >= v.S[t]),
+                    And(v.S[t] == v.S[t - 1], v.qdel_old[t - 1])))
+
         # We don't know what happened at t < 0, so we'll let the solver pick
-        # non-deterministically
-        s.add(
-            Implies(And(v.S[t] != v.S[t - 1], v.A[0] - v.L[0] < v.S[t - 1]),
-                    Not(v.qdel[t][t - 1])))
+        # non-deterministically. For t = 0, qdel[0][-1] is false anyway
+        if 0 < t <= H:
+            s.add(
+                Implies(And(v.S[t] != v.S[t - 1],
+                            v.acc[0] < v.S[t - 1]),
+                        Not(v.qdel[t][t - 1])))
+        elif t > H:
+            # qdel[t][t - 1] is beyond the horizon, so spell it out
+            s.add(
+                Implies(And(v.S[t] != v.S[t - 1],
+                            v.acc[0] < v.S[t - 1]),
+                        Not(And(v.acc[0] < v.S[t],
+                                v.acc[1] >= v.S[t]))))
 
 
 def multi_flows(c: ModelConfig, s: MySolver, v: Variables):
     assert (c.calculate_qdel)
+    if c.qdel_encoding == "int":
+        # Same constraints as below, indexing A_f by qdel_idx instead of
+        # enumerating every dt
+        for n in range(c.N):
+            arrival = Function(f"{v.pre}arrival_fn_{n}", IntSort(),
+                               RealSort())
+            for t in range(c.T):
+                s.add(arrival(t) == v.A_f[n][t])
+            for t in range(1, c.T):
+                s.add(Implies(v.qdel_idx[t] >= 0,
+                              v.S_f[n][t] > arrival(t - v.qdel_idx[t] - 1)))
+        return
+
+    H = c.look_back()
     for t in range(c.T):
         for n in range(c.N):
-            for dt in range(c.T):
+            for dt in range(H):
                 if t - dt - 1 < 0:
                     continue
                 s.add(
                     Implies(v.qdel[t][dt], v.S_f[n][t] > v.A_f[n][t - dt - 1]))
+            if H < c.T and t - 1 >= H:
+                # For dt >= H, the above constraints imply this since A_f is
+                # monotone
+                s.add(Implies(v.qdel_old[t], v.S_f[n][t] > v.A_f[n][0]))
 
 
 def epsilon_alpha(c: ModelConfig, s: MySolver, v: Variables):
@@ -217,10 +353,12 @@ def min_send_quantum(c: ModelConfig, s: MySolver, v: Variables):
 def cca_const(c: ModelConfig, s: MySolver, v: Variables):
     for n in range(c.N):
         for t in range(c.T):
-            s.add(v.c_f[n][t] == v.alpha)
+            if not v.fold_cwnd:
+                s.add(v.c_f[n][t] == v.alpha)
 
             if c.pacing:
-                s.add(v.r_f[n][t] == v.alpha / c.R)
+                if not v.fold_rate:
+                    s.add(v.r_f[n][t] == v.alpha / c.R)
             else:
                 s.add(v.r_f[n][t] >= c.C * 100)
 
@@ -262,12 +400,33 @@ def make_solver(c: ModelConfig,
     else:
         assert(False)
 
+    if c.invariants:
+        add_invariants(c, s, v)
+    if c.bound_propagation:
+        add_bounds(c, s, v)
+
     return (s, v)
 
 
+def folding_report(c: ModelConfig) -> str:
+    ''' How many variables and assertions fold_constants removes from the
+    model for `c` '''
+    counts = []
+    for fold in [False, True]:
+        cfg = copy(c)
+        cfg.fold_constants = fold
+        s, _ = make_solver(cfg)
+        assertions = list(s.assertions())
+        counts.append((len(collect_consts(assertions)), len(assertions)))
+    (n_vars, n_asserts), (n_vars_fold, n_asserts_fold) = counts
+    return (f"Folding constants removed {n_vars - n_vars_fold} of {n_vars} "
+            f"variables and {n_asserts - n_asserts_fold} of {n_asserts} "
+            "assertions")
+
+
 if __name__ == "__main__":
+    from cache import run_query
     from plot import plot_model
-    from pyz3_utils import run_query
     from utils import make_periodic
 
     c = ModelConfig(N=1,
@@ -0,0 +1,91 @@
+''' Compute exact bounds on a linear objective with Z3's optimizer (OMT).
+
+Questions like "what is Copa's minimum utilization" can be answered with a
+single optimization query instead of a sequence of sat/unsat queries in a
+binary search. The result is the exact rational infimum (or supremum) rather
+than an `err`-wide bracket. '''
+
+from fractions import Fraction
+from typing import Optional
+import z3
+
+from config import ModelConfig
+from pyz3_utils import MySolver
+from utils import ModelDict, model_to_dict
+from variables import Variables
+
+
+class OptResult:
+    # "sat" if the constraints are feasible, "unsat" if they are not, and
+    # "unknown" if Z3 could not decide in time
+    satisfiable: str
+    # The infimum (when minimizing) or supremum (when maximizing). None if the
+    # objective is unbounded or the query is not sat
+    value: Optional[Fraction]
+    # Whether the objective is unbounded in the optimization direction
+    unbounded: bool
+    # Whether some assignment achieves `value`. If False, `value` is only
+    # approached, e.g. because of a strict inequality in the constraints
+    attained: bool
+    # An assignment satisfying the constraints. If the optimum is attained,
+    # this achieves it
+    model: Optional[ModelDict]
+
+    def __init__(self, satisfiable: str, value: Optional[Fraction] = None,
+                 unbounded: bool = False, attained: bool = False,
+                 model: Optional[ModelDict] = None):
+        self.satisfiable = satisfiable
+        self.value = value
+        self.unbounded = unbounded
+        self.attained = attained
+        self.model = model
+
+    def __str__(self) -> str:
+        if self.satisfiable != "sat":
+            return self.satisfiable
+        if self.unbounded:
+            return "unbounded"
+        return f"{self.value} ({'attained' if self.attained else 'not attained'})"
+
+
+def to_fraction(x: z3.ExprRef) -> Optional[Fraction]:
+    ''' The value of a Z3 numeral, or None if `x` is not one '''
+    if z3.is_int_value(x):
+        return Fraction(x.as_long())
+    if z3.is_rational_value(x):
+        return Fraction(x.numerator_as_long(), x.denominator_as_long())
+    return None
+
+
+def optimize_bound(c: ModelConfig, s: MySolver, v: Variables,
+                   objective: z3.ArithRef, maximize: bool = False,
+                   timeout: float = 10) -> OptResult:
+    '''Find the infimum (or supremum if `maximize`) of `objective` subject to
+    the constraints in `s`, e.g. `v.S[-1] - v.S[0]` for a query built by
+    make_solver. `objective` must be linear
+
+    '''
+    opt = z3.Optimize()
+    opt.set(timeout=int(timeout * 1000))
+    opt.add(s.assertions())
+    if maximize:
+        handle = opt.maximize(objective)
+    else:
+        handle = opt.minimize(objective)
+
+    satisfiable = str(opt.check())
+    if satisfiable != "sat":
+        return OptResult(satisfiable)
+
+    # Z3 represents the bound as inf * oo + val + eps * epsilon
+    if maximize:
+        inf, val, eps = opt.upper_values(handle)
+    else:
+        inf, val, eps = opt.lower_values(handle)
+    # They are Int numerals if the bound is integral, and we treat anything
+    # that is not a numeral as unbounded
+    inf, val, eps = to_fraction(inf), to_fraction(val), to_fraction(eps)
+    model = model_to_dict(opt.model())
+    if inf is None or val is None or eps is None or inf != 0:
+        return OptResult("sat", unbounded=True, model=model)
+    return OptResult("sat", val, attained=eps == 0, model=model)
@@ -0,0 +1,158 @@
+''' Find thresholds by testing several points at once in worker processes.
+
+This is a parallel version of BinarySearch. With k workers, every round shrinks
+the search bracket by a factor of about k+1 instead of 2. Results are used as
+soon as they arrive: the bracket is narrowed, probes whose answer no longer
+matters are killed, and the freed workers are given new points. '''
+
+import multiprocessing as mp
+from multiprocessing.connection import Connection, wait
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cache import run_query
+from config import ModelConfig
+from pyz3_utils import MySolver, sat_to_val
+from variables import Variables
+
+ModelCons = Callable[[ModelConfig, float], Tuple[MySolver, Variables]]
+
+
+class KarySearch:
+    '''Same contract as BinarySearch: points that evaluate to 1 (sat) lie below
+    points that evaluate to 3 (unsat), and 2 (unknown) can happen anywhere in
+    between. Points are tested until the bracket(s) on either side of the
+    unknown region are narrower than `err`.
+
+    '''
+    def __init__(self, lo: float, hi: float, err: float,
+                 k: Optional[int] = None):
+        self.lo = lo
+        self.hi = hi
+        self.err = err
+        # Number of points to test in parallel
+        self.k = k if k is not None else (os.cpu_count() or 1)
+        # Smallest and largest points that returned unknown
+        self.unknown: Optional[Tuple[float, float]] = None
+
+    def gaps(self) -> List[Tuple[float, float]]:
+        ''' Intervals that still need to be searched '''
+        if self.unknown is None:
+            gaps = [(self.lo, self.hi)]
+        else:
+            gaps = [(self.lo, self.unknown[0]), (self.unknown[1], self.hi)]
+        return [(lo, hi) for (lo, hi) in gaps if hi - lo > self.err]
+
+    def relevant(self, pt: float) -> bool:
+        ''' Whether testing `pt` can still narrow the bracket '''
+        return any(lo < pt < hi for (lo, hi) in self.gaps())
+
+    def next_pt(self,
+                pending: Optional[List[float]] = None) -> Optional[float]:
+        '''Next point to test, given the points currently being tested. Picks
+        the midpoint of the widest interval that is not already split by a
+        pending point. Returns None if there is nothing useful to test
+
+        '''
+        if pending is None:
+            pending = []
+        best: Optional[Tuple[float, float]] = None
+        for (lo, hi) in self.gaps():
+            pts = [lo] + sorted(p for p in pending if lo < p < hi) + [hi]
+            for a, b in zip(pts[:-1], pts[1:]):
+                if b - a > self.err and (best is None
+                                         or b - a > best[1] - best[0]):
+                    best = (a, b)
+        if best is None:
+            return None
+        return (best[0] + best[1]) / 2
+
+    def register_pt(self, pt: float, val: int):
+        if val == 1:
+            self.lo = max(self.lo, pt)
+        elif val == 3:
+            self.hi = min(self.hi, pt)
+        else:
+            assert(val == 2)
+            if self.unknown is None:
+                self.unknown = (pt, pt)
+            else:
+                self.unknown = (min(self.unknown[0], pt),
+                                max(self.unknown[1], pt))
+
+        # Later results can make part of the unknown region irrelevant
+        if self.unknown is not None:
+            ulo, uhi = max(self.unknown[0], self.lo), min(self.unknown[1],
+                                                          self.hi)
+            self.unknown = (ulo, uhi) if ulo <= uhi else None
+
+    def get_bounds(self) -> Tuple[float, Optional[Tuple[float, float]],
+                                  float]:
+        return (self.lo, self.unknown, self.hi)
+
+
+def probe(model_cons: ModelCons, cfg: ModelConfig, thresh: float,
+          timeout: float, conn: Connection):
+    ''' Runs in a worker process '''
+    s, v = model_cons(cfg, thresh)
+    qres = run_query(cfg, s, v, timeout=timeout)
+    conn.send(qres.satisfiable)
+    conn.close()
+
+
+def find_bound_parallel(model_cons: ModelCons, cfg: ModelConfig,
+                        search: KarySearch, timeout: float,
+                        reverse: bool = False):
+    '''Like utils.find_bound, but tests up to search.k thresholds at once.
+    `model_cons` is called in the worker processes, so it should be a
+    module-level function
+
+    '''
+    # Probes that are currently running, keyed by the read end of their pipe
+    running: Dict[Connection, Tuple[float, mp.Process]] = {}
+    try:
+        while True:
+            # Kill probes whose answer can no longer narrow the bracket
+            for conn, (thresh, proc) in list(running.items()):
+                if not search.relevant(thresh):
+                    print(f"Interrupting threshold = {thresh}")
+                    proc.terminate()
+                    proc.join()
+                    conn.close()
+                    del running[conn]
+
+            # Give idle workers new points
+            while len(running) < search.k:
+                thresh = search.next_pt([t for (t, _) in running.values()])
+                if thresh is None:
+                    break
+                print(f"Testing threshold = {thresh}")
+                recv_conn, send_conn = mp.Pipe(duplex=False)
+                proc = mp.Process(target=probe, args=(model_cons, cfg, thresh,
+                                                      timeout, send_conn))
+                proc.start()
+                send_conn.close()
+                running[recv_conn] = (thresh, proc)
+
+            if len(running) == 0:
+                break
+
+            for conn in wait(list(running.keys())):
+                thresh, proc = running.pop(conn)
+                try:
+                    satisfiable = conn.recv()
+                except EOFError:
+                    # The worker died without answering (e.g. it ran out of
+                    # memory). We learn nothing from this point
+                    print(f"Worker for threshold = {thresh} died")
+                    satisfiable = "unknown"
+                conn.close()
+                proc.join()
+                print(f"Threshold = {thresh}: {satisfiable}")
+                search.register_pt(thresh, sat_to_val(satisfiable, reverse))
+    finally:
+        for conn, (_, proc) in running.items():
+            proc.terminate()
+            proc.join()
+            conn.close()
+    return search.get_bounds()
@@ -5,7 +5,7 @@ import pickle as pkl
 import sys
 from typing import List, Optional, Tuple, Union
 
-from pyz3_utils import QueryResult
+from cache import QueryResult
 from config import ModelConfig
 from utils import ModelDict
 from variables import VariableNames
@@ -87,16 +87,20 @@ def plot_model(m: ModelDict, c: ModelConfig, v: VariableNames):
             print(f"Flow {n}")
             for t in range(c.T):
                 print("{:<3}".format(t), end=": ")
-                for dt in range(c.T):
+                for dt in range(c.look_back()):
                     iname = f"incr_allowed_{n},{t},{dt}"
                     dname = f"decr_allowed_{n},{t},{dt}"
-                    qname = f"qdel_{t},{dt}"
-                    if iname not in m:
-                        print(f" - /{int(m[qname])}", end=" ")
+                    if c.qdel_encoding == "int":
+                        qdel = int(m[f"qdel_idx_{t}"] == dt)
+                    elif dt > t:
+                        # Not a variable. See Variables
+                        qdel = 0
                     else:
-                        print(
-                            f"{int(m[iname])}/{int(m[dname])}/{int(m[qname])}",
-                            end=" ")
+                        qdel = int(m[f"qdel_{t},{dt}"])
+                    # Unreachable lags have no variables. See cca_copa
+                    incr = int(m[iname]) if iname in m else "-"
+                    decr = int(m[dname]) if dname in m else "-"
+                    print(f"{incr}/{decr}/{qdel}", end=" ")
                 print("")
 
     acc_flows: List[Any] = [v.W, v.S, v.A, v.L]
@@ -107,7 +111,9 @@ def plot_model(m: ModelDict, c: ModelConfig, v: VariableNames):
         per_flow.append("last_loss")
     if c.cca == "bbr":
         for n in range(c.N):
-            print("BBR start state = ", m[f"bbr_start_state_{n}"])
+            print("BBR start state = ",
+                  *[x.split(",")[-1] for x in m
+                    if x.startswith(f"bbr_start_state_{n},") and m[x]])
             per_flow.extend(["max_rate"])
 
     # def printable(names) -> str:
@@ -142,23 +148,25 @@ def plot_model(m: ModelDict, c: ModelConfig, v: VariableNames):
         vals = ["%.10f" % float(v) for v in vals]
         print(f"{t: <2}", ("{:<15}" * len(vals)).format(*vals))
 
+    # Take per-flow series from `v` rather than building names. With N=1, the
+    # per-flow lists are the totals (e.g. L_f[0] is L). See Variables
     for n in range(c.N):
         args = {'marker': 'o', 'linestyle': linestyles[n]}
 
         if c.N > 1:
-            ax1.plot(times, to_arr("service", n) - adj,
+            ax1.plot(times, to_arr(v.S_f, n) - adj,
                      color='red', label='Egress %d' % n, **args)
-            ax1.plot(times, to_arr("arrival", n) - adj,
+            ax1.plot(times, to_arr(v.A_f, n) - adj,
                      color='blue', label='Ingress %d' % n, **args)
 
-        ax1.plot(times, to_arr("losts", n) - adj,
+        ax1.plot(times, to_arr(v.L_f, n) - adj,
                  color='orange', label='Num lost %d' % n, **args)
-        ax1.plot(times, to_arr("loss_detected", n)-adj,
+        ax1.plot(times, to_arr(v.Ld_f, n)-adj,
                  color='yellow', label='Num lost detected %d' % n, **args)
 
-        ax2.plot(times, to_arr("cwnd", n),
+        ax2.plot(times, to_arr(v.c_f, n),
                  color='black', label='Cwnd %d' % n, **args)
-        ax2_rate.plot(times, to_arr("rate", n),
+        ax2_rate.plot(times, to_arr(v.r_f, n),
                       color='orange', label='Rate %d' % n, **args)
 
     # Determine queuing delay
@@ -229,6 +237,6 @@ if __name__ == "__main__":
     print(qres.satisfiable)
     if qres.satisfiable == "sat":
         assert(qres.model is not None)
-        plot_model(qres.model, qres.cfg)
+        plot_model(qres.model, qres.cfg, qres.v)
     else:
         print("The query was unsatisfiable, so there is nothing to plot")
@@ -0,0 +1,85 @@
+''' Run a batch of queries with escalating timeouts.
+
+Sweeps typically use a small fixed timeout and treat `unknown` as final.
+`run_batch` instead runs every query with a short timeout first, then retries
+only the ones that came back `unknown` with geometrically larger timeouts until
+the time budget runs out.
+
+The largest timeout a query failed with is remembered through the cache: the
+cache stores an `unknown` together with the timeout it was obtained with, so a
+later run starts that query at the next larger timeout instead of repeating
+futile short attempts. '''
+
+import time
+from typing import Any, List, Optional, Tuple
+
+from cache import QueryResult, cache_file, load, run_query
+from config import ModelConfig
+from pyz3_utils import MySolver
+from variables import Variables
+
+Query = Tuple[ModelConfig, MySolver, Variables]
+
+
+def first_timeout(c: ModelConfig, s: MySolver, initial_timeout: float,
+                  factor: float) -> Tuple[Optional[QueryResult], float]:
+    '''The cached result of the query (if any) and the timeout to try it with
+    next. A query that is already known to fail with timeout t is next tried
+    with t * factor
+
+    '''
+    qres = load(cache_file(c, s))
+    if qres is None or qres.satisfiable != "unknown":
+        return (qres, initial_timeout)
+    return (qres, max(initial_timeout, qres.timeout * factor))
+
+
+def run_batch(queries: List[Query], initial_timeout: float = 10,
+              factor: float = 4, budget: float = 3600,
+              **kwargs: Any) -> List[Optional[QueryResult]]:
+    '''Solve `queries`, retrying the `unknown` ones with timeouts that grow by
+    `factor` each round, until every query is decided or the total solve time
+    would exceed `budget` seconds. Extra arguments are passed to run_query.
+    Returns the latest result for each query, or None if the budget ran out
+    before it could be run at all
+
+    '''
+    results: List[Optional[QueryResult]] = []
+    timeouts: List[float] = []
+    for (c, s, _) in queries:
+        qres, timeout = first_timeout(c, s, initial_timeout, factor)
+        results.append(qres)
+        timeouts.append(timeout)
+
+    spent = 0.0
+    while True:
+        # Queries that ran out of memory will not succeed with a longer
+        # timeout
+        pending = [i for i in range(len(queries))
+                   if results[i] is None
+                   or (results[i].satisfiable == "unknown"
+                       and results[i].reason != "memory")]
+        # Only start attempts that can finish within the budget. A shorter
+        # attempt would not teach us anything new
+        pending = [i for i in pending if spent + timeouts[i] <= budget]
+        if len(pending) == 0:
+            break
+
+        for i in sorted(pending, key=lambda i: timeouts[i]):
+            if spent + timeouts[i] > budget:
+                continue
+            c, s, v = queries[i]
+            print(f"Query {i}: trying timeout {timeouts[i]}s "
+                  f"({budget - spent:.0f}s of budget left)")
+            start = time.time()
+            results[i] = run_query(c, s, v, timeouts[i], **kwargs)
+            spent += time.time() - start
+            print(f"Query {i}: {results[i].satisfiable}")
+            if results[i].satisfiable == "unknown":
+                timeouts[i] *= factor
+
+    undecided = sum(1 for r in results if r is None
+                    or r.satisfiable == "unknown")
+    print(f"Spent {spent:.0f}s. {len(queries) - undecided} of {len(queries)} "
+          "queries decided")
+    return results
@@ -0,0 +1,130 @@
+''' Cone-of-influence slicing of queries.
+
+`make_solver` emits every constraint for all T timesteps, even if the query
+only asks about the first few. `slice_query` keeps only the constraints that
+can affect the variables the query mentions:
+
+1. Constraints that mention a timestep after the last timestep in the query
+   are dropped.
+2. Of the rest, only those connected to the query's variables (through
+   chains of constraints sharing a variable) are kept.
+
+The slice is a subset of the constraints, so if it is unsat, so is the full
+query. A sat slice is inconclusive, which is why `run_sliced` falls back to
+the full query in that case. '''
+
+from typing import Any, Dict, List, Set, Tuple
+import z3
+
+from cache import QueryResult, run_query
+from config import ModelConfig
+from pyz3_utils import MySolver
+from utils import collect_consts
+from variables import Variables
+
+
+class SliceReport:
+    def __init__(self, t_max: int, kept_assertions: int,
+                 total_assertions: int, kept_vars: int, total_vars: int):
+        # The last timestep the query mentions
+        self.t_max = t_max
+        self.kept_assertions = kept_assertions
+        self.total_assertions = total_assertions
+        self.kept_vars = kept_vars
+        self.total_vars = total_vars
+
+    def __str__(self) -> str:
+        return (f"Slice up to t={self.t_max} kept {self.kept_assertions} of "
+                f"{self.total_assertions} assertions and {self.kept_vars} of "
+                f"{self.total_vars} variables")
+
+
+def time_index(c: ModelConfig, v: Variables) -> Dict[str, int]:
+    '''The timestep of each variable in `v`. Variables without a timestep
+    (e.g. alpha) and CCA-internal variables are not included
+
+    '''
+    res: Dict[str, int] = {}
+
+    def visit(x: Any, t: int):
+        for name in collect_consts([x]):
+            res[name] = max(res.get(name, t), t)
+
+    for attr, val in v.__dict__.items():
+        if type(val) != list:
+            continue
+        if attr.endswith("_f"):
+            # Indexed as [n][t]
+            val = [val[n][t] for n in range(c.N) for t in range(c.T)]
+            for i, x in enumerate(val):
+                visit(x, i % c.T)
+            continue
+        for t in range(c.T):
+            # Either [t] or, for qdel, [t][dt]
+            if type(val[t]) == list:
+                for x in val[t]:
+                    visit(x, t)
+            else:
+                visit(val[t], t)
+    return res
+
+
+def slice_query(c: ModelConfig, s: MySolver, v: Variables,
+                query: List[z3.BoolRef]) \
+        -> Tuple[List[z3.BoolRef], SliceReport]:
+    '''The constraints in `s` that can affect `query`, which should be the
+    constraints added to the output of make_solver (and also be in `s`)
+
+    '''
+    times = time_index(c, v)
+    assertions = list(s.assertions())
+    consts = [set(collect_consts([a])) for a in assertions]
+    t_max = max([times[x] for x in collect_consts(query) if x in times],
+                default=c.T - 1)
+
+    # Constraints within the time window, indexed by the variables they use
+    users: Dict[str, List[int]] = {}
+    for i in range(len(assertions)):
+        if all(times.get(x, 0) <= t_max for x in consts[i]):
+            for x in consts[i]:
+                users.setdefault(x, []).append(i)
+
+    # Everything connected to the query
+    kept: Set[int] = set()
+    seen: Set[str] = set()
+    stack = list(collect_consts(query))
+    while len(stack) > 0:
+        x = stack.pop()
+        if x in seen:
+            continue
+        seen.add(x)
+        for i in users.get(x, []):
+            if i not in kept:
+                kept.add(i)
+                stack.extend(consts[i])
+
+    all_vars: Set[str] = set().union(*consts)
+    report = SliceReport(t_max, len(kept), len(assertions), len(seen),
+                         len(all_vars))
+    return ([assertions[i] for i in sorted(kept)], report)
+
+
+def run_sliced(c: ModelConfig, s: MySolver, v: Variables,
+               query: List[z3.BoolRef], timeout: float = 10,
+               **kwargs: Any) -> QueryResult:
+    '''Like run_query, but first tries the slice of the query. If the slice is
+    unsat, that is the answer. Otherwise the full query is solved. Extra
+    arguments are passed to run_query
+
+    '''
+    sliced, report = slice_query(c, s, v, query)
+    print(report)
+    # The variables are declared in `s`, so the slice goes in a plain solver
+    ss = z3.Solver()
+    ss.add(*sliced)
+    qres = run_query(c, ss, v, timeout, **kwargs)
+    if qres.satisfiable == "unsat":
+        return qres
+    print(f"Slice is {qres.satisfiable}, which is inconclusive. Solving the "
+          "full query")
+    return run_query(c, s, v, timeout, **kwargs)
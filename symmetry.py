@@ -0,0 +1,103 @@
+''' Symmetry breaking for multi-flow queries.
+
+All flows run the same CCA (`ModelConfig.cca`), so the model built by
+`make_solver` does not change when the flows are permuted. If the query's own
+constraints do not change either, every counter-example comes in N! copies
+that differ only in the order of the flows, and Z3 has to refute each of them
+separately. `break_symmetry` checks that the query is symmetric and, if so,
+requires the flows to be sorted by their initial state, which keeps one copy,
+e.g.
+
+    s, v = make_solver(c)
+    query = [v.S[-1] - v.S[0] < 0.1 * c.C * c.T]
+    s.add(And(query))
+    break_symmetry(c, s, v, query) '''
+
+from typing import List, Set, Tuple
+import z3
+
+from config import ModelConfig
+from pyz3_utils import MySolver
+from utils import collect_consts
+from variables import Variables
+
+
+def flatten(x) -> List[z3.ExprRef]:
+    ''' All Z3 expressions in a (possibly nested) list '''
+    if type(x) == list:
+        return [y for z in x for y in flatten(z)]
+    if isinstance(x, z3.ExprRef):
+        return [x]
+    return []
+
+
+def flow_permutation(c: ModelConfig, v: Variables, perm: List[int]) \
+        -> List[Tuple[z3.ExprRef, z3.ExprRef]]:
+    '''Substitution that maps the per-flow variables (the X_f attributes of
+    `v`) of flow n to those of flow perm[n]
+
+    '''
+    res = []
+    for x in v.__dict__:
+        if not x.endswith("_f"):
+            continue
+        for n in range(c.N):
+            for a, b in zip(v.__dict__[x][n], v.__dict__[x][perm[n]]):
+                if z3.is_const(a) \
+                   and a.decl().kind() == z3.Z3_OP_UNINTERPRETED:
+                    res.append((a, b))
+    return res
+
+
+def is_symmetric(c: ModelConfig, v: Variables, query: List[z3.BoolRef],
+                 timeout: float = 10) -> bool:
+    '''Whether `query` is unchanged by every permutation of the flows. It
+    suffices to check a transposition and a rotation, since they generate all
+    permutations. Returns False if Z3 cannot decide it within `timeout`, or if
+    the query uses variables other than those in `v`, which may be per-flow
+    CCA variables we do not know how to permute
+
+    '''
+    per_flow: Set[str] = set()
+    shared: Set[str] = set()
+    for x in v.__dict__:
+        consts = collect_consts(flatten(v.__dict__[x]))
+        if x.endswith("_f"):
+            per_flow.update(consts)
+        else:
+            shared.update(consts)
+    if not set(collect_consts(query)).issubset(per_flow | shared):
+        return False
+
+    swap = [1, 0] + list(range(2, c.N))
+    rotate = [(n + 1) % c.N for n in range(c.N)]
+    for perm in [swap, rotate]:
+        s = z3.Solver()
+        s.set(timeout=int(timeout * 1000))
+        permuted = z3.substitute(z3.And(query), *flow_permutation(c, v, perm))
+        s.add(z3.And(query) != permuted)
+        if str(s.check()) != "unsat":
+            return False
+    return True
+
+
+def break_symmetry(c: ModelConfig, s: MySolver, v: Variables,
+                   query: List[z3.BoolRef]) -> bool:
+    '''If `query` (the constraints added to the output of make_solver) is
+    symmetric across flows, add constraints that require the flows to be in
+    lexicographic order of (c_f[n][0], A_f[n][0]). Returns whether they were
+    added. This does not change whether `s` is satisfiable
+
+    '''
+    if c.N < 2:
+        # Nothing to permute
+        return False
+    if not is_symmetric(c, v, query):
+        print("Query is not symmetric across flows. Not breaking symmetry")
+        return False
+    for n in range(c.N - 1):
+        s.add(z3.Or(
+            v.c_f[n][0] < v.c_f[n + 1][0],
+            z3.And(v.c_f[n][0] == v.c_f[n + 1][0],
+                   v.A_f[n][0] <= v.A_f[n + 1][0])))
+    return True
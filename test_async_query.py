@@ -0,0 +1,90 @@
+import asyncio
+import os
+import threading
+import time
+from types import SimpleNamespace
+import unittest
+from unittest import mock
+from z3 import And, Not, Or
+
+import async_query
+import cache
+from async_query import run_query_async
+from cache import cache_file, run_query, stats
+from config import ModelConfig
+from model import make_solver
+from test_cache import TempCacheTestCase
+
+
+def make_query(bound: float, hard: bool = False):
+    ''' Sat iff bound > 0. If `hard`, also add a pigeonhole problem that Z3
+    cannot refute within the tests' timeouts '''
+    c = ModelConfig.default()
+    c.T = 3
+    s, v = make_solver(c)
+    s.add(v.S[-1] - v.S[0] < bound)
+    if hard:
+        n = 12
+        p = [[s.Bool(f"pigeon_{i},{j}") for j in range(n - 1)]
+             for i in range(n)]
+        for i in range(n):
+            s.add(Or(*p[i]))
+        for j in range(n - 1):
+            for i in range(n):
+                for k in range(i + 1, n):
+                    s.add(Not(And(p[i][j], p[k][j])))
+    return (c, s, v)
+
+
+class LateEvent(threading.Event):
+    ''' An Event whose is_set() returns the state from before the event is
+    set, but only once it has been set. This forces the worker to start Z3
+    just after the query has been cancelled '''
+    def is_set(self) -> bool:
+        was_set = super().is_set()
+        self.wait(5)
+        return was_set
+
+
+class TestAsyncQuery(TempCacheTestCase):
+    def test_cache(self):
+        # Shares the cache, and its accounting, with run_query
+        c, s, v = make_query(1)
+        hits, misses = stats.hits, stats.misses
+        qres = asyncio.run(run_query_async(c, s, v))
+        self.assertEqual(qres.satisfiable, "sat")
+        self.assertTrue(os.path.exists(cache_file(c, s)))
+        with mock.patch.object(cache, "solve", side_effect=AssertionError):
+            self.assertEqual(run_query(c, s, v).model, qres.model)
+        self.assertEqual((stats.hits, stats.misses), (hits + 1, misses + 1))
+
+        results = asyncio.run(self.gather([make_query(-1), make_query(2)]))
+        self.assertEqual([r.satisfiable for r in results], ["unsat", "sat"])
+
+    async def gather(self, queries):
+        return await asyncio.gather(*[run_query_async(c, s, v)
+                                      for (c, s, v) in queries])
+
+    def test_cancel(self):
+        # Cancelling stops Z3 promptly, however early it happens, and nothing
+        # is cached
+        async def cancel_after(delay: float):
+            c, s, v = make_query(1, hard=True)
+            task = asyncio.ensure_future(run_query_async(c, s, v, 30))
+            await asyncio.sleep(delay)
+            task.cancel()
+            start = time.time()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertLess(time.time() - start, 5)
+            self.assertFalse(os.path.exists(cache_file(c, s)))
+
+        for delay in [0, 0.001, 0.01, 0.1, 0.5]:
+            asyncio.run(cancel_after(delay))
+        with mock.patch.object(async_query, "threading",
+                               SimpleNamespace(Event=LateEvent)):
+            asyncio.run(cancel_after(0.1))
+
+
+if __name__ == '__main__':
+    unittest.main()
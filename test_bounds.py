@@ -0,0 +1,74 @@
+from fractions import Fraction
+import unittest
+from z3 import And, Real, RealVal, Solver
+
+from bounds import BoundPropagator, derive_bounds
+from config import ModelConfig
+from model import make_solver
+from pyz3_utils import MySolver
+
+
+class TestBounds(unittest.TestCase):
+    def test_propagate(self):
+        s = MySolver()
+        x, y, z = s.Real("x"), s.Real("y"), s.Real("z")
+        s.add(x >= 1)
+        s.add(2 * x + y <= 10)
+        s.add(And(y - z / 2 >= 0, z == 4))
+        # Non-linear and disjunctive constraints are ignored
+        s.add(x * y <= 1)
+        bounds, _, explicit = derive_bounds(s)
+        self.assertEqual(bounds["x"], (1, 4))
+        self.assertEqual(bounds["y"], (2, 8))
+        self.assertEqual(bounds["z"], (4, 4))
+        self.assertEqual(explicit["x"], (1, None))
+
+    def test_linear(self):
+        bp = BoundPropagator()
+        x, y = Real("x"), Real("y")
+        self.assertEqual(bp.linear(3 * (x - y / 4) + 2),
+                         ({"x": 3, "y": Fraction(-3, 4)}, 2))
+        self.assertIsNone(bp.linear(x * y))
+
+    def test_implied(self):
+        # Every derived bound must follow from the model
+        for cca in ["aimd", "copa"]:
+            c = ModelConfig.default()
+            c.T = 6
+            c.cca = cca
+            c.calculate_qdel = True
+            c.buf_min = 1
+            c.buf_max = 2
+            c.alpha = 1.0
+            s, v = make_solver(c)
+            bounds, vars, _ = derive_bounds(s)
+            # E.g. S[t] <= C*t - W[t] and S[t] >= 0
+            self.assertEqual(bounds["wasted_3"][1], 3)
+            self.assertEqual(bounds["tot_service_3"], (0, 4))
+            for x, (lo, hi) in bounds.items():
+                for bad in ([vars[x] < RealVal(str(lo))] if lo is not None
+                            else []) + \
+                           ([vars[x] > RealVal(str(hi))] if hi is not None
+                            else []):
+                    ss = Solver()
+                    ss.add(s.assertions())
+                    ss.add(bad)
+                    self.assertEqual(str(ss.check()), "unsat")
+
+    def test_same_result(self):
+        for thresh in [0.1, 0.9]:
+            res = []
+            for bp in [False, True]:
+                c = ModelConfig.default()
+                c.T = 8
+                c.cca = "copa"
+                c.calculate_qdel = True
+                c.bound_propagation = bp
+                s, v = make_solver(c)
+                s.add(And(v.L[0] == 0, v.S[-1] - v.S[0] < thresh * c.C * c.T))
+                res.append(str(s.check()))
+            self.assertEqual(res[0], res[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import cache
+from cache import QueryResult, cache_file, evict, load, run_query, stats
+from config import ModelConfig
+from model import make_solver
+
+
+def simple_query(bound: float):
+    ''' A small query that is sat iff bound > 0 '''
+    c = ModelConfig.default()
+    c.T = 3
+    s, v = make_solver(c)
+    s.add(v.S[-1] - v.S[0] < bound)
+    return (c, s, v)
+
+
+class TempCacheTestCase(unittest.TestCase):
+    ''' Runs each test with an empty, temporary cache folder, so tests
+    neither read nor write the real cache '''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(cache, "CACHE_DIR", self.tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+
+
+class TestCache(TempCacheTestCase):
+    def test_hit(self):
+        c, s, v = simple_query(1)
+        hits, misses = stats.hits, stats.misses
+        qres = run_query(c, s, v)
+        self.assertEqual(qres.satisfiable, "sat")
+        self.assertEqual((stats.hits, stats.misses), (hits, misses + 1))
+        self.assertTrue(os.path.exists(cache_file(c, s)))
+
+        # An identical query built from scratch is not solved again
+        c, s, v = simple_query(1)
+        with mock.patch.object(cache, "solve", side_effect=AssertionError):
+            cached = run_query(c, s, v)
+        self.assertEqual((stats.hits, stats.misses), (hits + 1, misses + 1))
+        self.assertEqual(cached.satisfiable, "sat")
+        self.assertEqual(cached.model, qres.model)
+
+        # A different query or config is a different file
+        c2, s2, _ = simple_query(-1)
+        self.assertNotEqual(cache_file(c, s), cache_file(c2, s2))
+        c.T += 1
+        self.assertNotEqual(cache_file(c, s), cache_file(c2, s2))
+
+    def test_unknown_timeout(self):
+        # A cached unknown is only reused for timeouts no larger than the one
+        # it was obtained with
+        c, s, v = simple_query(1)
+        unknown = QueryResult("unknown", None, c, None, 5, 5)
+        with mock.patch.object(cache, "solve", return_value=unknown) as solve:
+            run_query(c, s, v, timeout=5)
+            run_query(c, s, v, timeout=5)
+            run_query(c, s, v, timeout=2)
+            self.assertEqual(solve.call_count, 1)
+            run_query(c, s, v, timeout=20)
+            self.assertEqual(solve.call_count, 2)
+
+    def test_unreadable(self):
+        c, s, v = simple_query(1)
+        with open(cache_file(c, s), "wb") as f:
+            f.write(b"not a pickle")
+        self.assertIsNone(load(cache_file(c, s)))
+        self.assertEqual(run_query(c, s, v).satisfiable, "sat")
+        self.assertIsNotNone(load(cache_file(c, s)))
+
+    def test_evict(self):
+        # Results are evicted least recently used first
+        fnames = []
+        for i in range(4):
+            c, s, v = simple_query(i + 1)
+            run_query(c, s, v)
+            fnames.append(cache_file(c, s))
+            os.utime(fnames[-1], (i, i))
+        # Using a result makes it the most recently used
+        load(fnames[0])
+        size = os.path.getsize(fnames[1])
+        evict(2 * size + size // 2)
+        self.assertEqual([os.path.exists(f) for f in fnames],
+                         [True, False, False, True])
+
+        # Other files in the folder are left alone
+        other = os.path.join(self.tmp.name, "notes.txt")
+        with open(other, "w") as f:
+            f.write("x" * 100)
+        evict(0)
+        self.assertEqual(os.listdir(self.tmp.name), ["notes.txt"])
+
+    def test_isolate(self):
+        # Solving in a child process gives the same answers
+        for bound in [1, -1]:
+            c, s, v = simple_query(bound)
+            direct = cache.solve(c, s, v, 10)
+            isolated = run_query(c, s, v, isolate=True)
+            self.assertEqual(isolated.satisfiable, direct.satisfiable)
+            if direct.satisfiable == "sat":
+                self.assertEqual(isolated.model.keys(), direct.model.keys())
+
+    def test_portfolio(self):
+        names = [sc.name for sc in cache.PORTFOLIO]
+        for bound, expected in [(1, "sat"), (-1, "unsat")]:
+            c, s, v = simple_query(bound)
+            qres = run_query(c, s, v, portfolio=3)
+            self.assertEqual(qres.satisfiable, expected)
+            self.assertIn(qres.solver_config, names[:3])
+        # The winner is cached with the result
+        self.assertEqual(load(cache_file(c, s)).solver_config,
+                         qres.solver_config)
+
+    def test_memory_limit(self):
+        # Z3 cannot even parse the query with 1 MB. The result is unknown and
+        # not cached, so it can be retried with a larger limit
+        c, s, v = simple_query(1)
+        qres = run_query(c, s, v, max_memory=1)
+        self.assertEqual(qres.satisfiable, "unknown")
+        self.assertEqual(qres.reason, "memory")
+        self.assertFalse(os.path.exists(cache_file(c, s)))
+        self.assertEqual(run_query(c, s, v, max_memory=1024 ** 3).satisfiable,
+                         "sat")
+        self.assertTrue(os.path.exists(cache_file(c, s)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,8 @@
 import unittest
-from z3 import And, Not, Or
+from z3 import And, Bool, Not, Or, Solver
 
 from model import Variables, cwnd_rate_arrival, epsilon_alpha,\
-    initial, loss_detected, monotone, network, relate_tot
+    initial, loss_detected, make_solver, monotone, network, relate_tot
 from cca_aimd import AIMDVariables, can_incr, cca_aimd
 from config import ModelConfig
 from pyz3_utils import MySolver
@@ -46,6 +46,91 @@ class TestCCAAimd(unittest.TestCase):
         sat = s.check()
         self.assertEqual(str(sat), "unsat")
 
+    def test_fold_constants(self):
+        # Folding the rate and dupacks into the constraints must not change
+        # what AIMD can do
+        for pacing in [False, True]:
+            c = ModelConfig.default()
+            c.cca = "aimd"
+            c.pacing = pacing
+            c.fold_constants = True
+            s, v = make_solver(c)
+            self.assertNotIn("rate_0,", str(s.assertions()))
+            self.assertNotIn("dupacks", str(s.assertions()))
+            s.add(v.S[4] - v.S[3] >= v.c_f[0][4])
+            s.add(Not(Bool("aimd_incr_0,4")))
+            self.assertEqual(str(s.check()), "unsat")
+
+            s, v = make_solver(c)
+            s.add(v.Ld_f[0][4] > v.Ld_f[0][3])
+            self.assertEqual(str(s.check()), "sat")
+
+    def test_can_incr_unchanged(self):
+        # can_incr must have the same semantics as the original encoding,
+        # which compared every pair of cwnds
+        def can_incr_pairwise(c, s, v, cv):
+            for t in range(1, c.T):
+                incr = []
+                for dt in range(1, t):
+                    incr.append(And(
+                        And([v.c_f[0][t-ddt] == v.c_f[0][t]
+                             for ddt in range(1, dt+1)]),
+                        v.c_f[0][t-dt-1] != v.c_f[0][t-dt],
+                        v.S_f[0][t] - v.S_f[0][t-dt] >= v.c_f[0][t]))
+                incr.append(And(
+                    And([v.c_f[0][t-ddt] == v.c_f[0][t]
+                         for ddt in range(1, t+1)]),
+                    v.S_f[0][t] - v.S_f[0][0] >= v.c_f[0][t]))
+                incr.append(And(
+                    v.S_f[0][t] - v.S_f[0][t-1] >= v.c_f[0][t]))
+                s.add(cv.incr_f[0][t] == Or(*incr))
+
+        c = ModelConfig.default()
+        c.aimd_incr_irrespective = False
+        s = MySolver()
+        v = Variables(c, s)
+        cv = AIMDVariables(c, s)
+        # v and cv are declared in `s`. can_incr declares its auxiliary
+        # Booleans in s_new, so it shares s's declarations
+        s_old, s_new = Solver(), MySolver()
+        s_new.variables = s.variables
+        can_incr_pairwise(c, s_old, v, cv)
+        can_incr(c, s_new, v, cv)
+        old, new = s_old.assertions(), s_new.assertions()
+
+        s.add(And(new))
+        s.add(Not(And(old)))
+        self.assertEqual(str(s.check()), "unsat")
+
+        # Given the definitions of the auxiliary variables
+        s = Solver()
+        s.add(And(old))
+        s.add(And([a for a in new if "aimd_incr_" not in str(a)]))
+        s.add(Not(And(new)))
+        self.assertEqual(str(s.check()), "unsat")
+
+    def test_can_incr_horizon(self):
+        # With a horizon, can_incr must allow every behavior it allows
+        # without one
+        c = ModelConfig.default()
+        c.T = 8
+        c.aimd_incr_irrespective = False
+        s = MySolver()
+        v = Variables(c, s)
+        monotone(c, s, v)
+        cv = AIMDVariables(c, s)
+        can_incr(c, s, v, cv)
+
+        c.horizon = 3
+        # v and cv are declared in `s`, and can_incr declares the same
+        # auxiliary Booleans as before, so share the declarations
+        sh = MySolver()
+        sh.variables = s.variables
+        can_incr(c, sh, v, cv)
+        s.add(Not(And(sh.assertions())))
+        sat = s.check()
+        self.assertEqual(str(sat), "unsat")
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+from z3 import And, Implies, Not, Or, Real
+
+from cca_bbr import cca_bbr
+from config import ModelConfig
+from model import Variables
+from pyz3_utils import MySolver
+
+
+class TestCCABbr(unittest.TestCase):
+    def test_max_rate(self):
+        # max_rate must be the max of the rates over the last 4 periods
+        c = ModelConfig.default()
+        c.cca = "bbr"
+        c.T = 14
+        for N in [1, 2]:
+            c.N = N
+            s = MySolver()
+            v = Variables(c, s)
+            cca_bbr(c, s, v)
+
+            conds = []
+            for n in range(c.N):
+                for t in range(2 * c.R, c.T):
+                    max_rate = Real(f"max_rate_{n},{t}")
+                    rates = [v.S_f[n][u] - v.S_f[n][u - c.R]
+                             for u in range(max(c.R, t - c.R - 3), t - c.R + 1)]
+                    conds.append(And(*[max_rate >= r for r in rates]))
+                    conds.append(Or(*[max_rate == r for r in rates]))
+            s.add(Not(And(*conds)))
+            self.assertEqual(str(s.check()), "unsat")
+
+    def test_start_state(self):
+        # The one-hot start state must have the same semantics as an Int
+        # start state in [0, 4)
+        def create(R: int):
+            c = ModelConfig.default()
+            c.cca = "bbr"
+            c.R = R
+            c.T = 10
+            s = MySolver()
+            v = Variables(c, s)
+            # Collect the encoding separately, but declare its variables in
+            # `s`, which the constraints are added to
+            s_new = MySolver()
+            s_new.variables = s.variables
+            cv = cca_bbr(c, s_new, v)
+            new = s_new.assertions()
+
+            start = s.Int("start_state")
+            s.add(And(start >= 0, start < 4))
+            s.add(And([cv.start_state_f[0][k] == (start == k)
+                       for k in range(4)]))
+            old = []
+            for t in range(2 * c.R, c.T):
+                s_0 = start == (0 - t / c.R) % 4
+                s_1 = start == (1 - t / c.R) % 4
+                max_rate = Real(f"max_rate_0,{t}")
+                old.append(Implies(s_0, v.r_f[0][t] == 1.25 * max_rate))
+                old.append(Implies(s_1, v.r_f[0][t] == 0.8 * max_rate))
+                old.append(Implies(And(Not(s_0), Not(s_1)),
+                                   v.r_f[0][t] == max_rate))
+            return (s, new, old)
+
+        def is_gain(a) -> bool:
+            return "bbr_start_state" in str(a) and "rate_" in str(a)
+
+        for R in [1, 2]:
+            # New implies old
+            s, new, old = create(R)
+            s.add(And(new))
+            s.add(Not(And(old)))
+            self.assertEqual(str(s.check()), "unsat")
+
+            # Old implies new, given the rest of the BBR constraints
+            s, new, old = create(R)
+            s.add(And(old))
+            s.add(And([a for a in new if not is_gain(a)]))
+            s.add(Not(And([a for a in new if is_gain(a)])))
+            self.assertEqual(str(s.check()), "unsat")
+
+
+if __name__ == '__main__':
+    unittest.main()
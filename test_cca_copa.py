@@ -0,0 +1,59 @@
+import unittest
+from z3 import And
+
+from config import ModelConfig
+from model import make_solver
+from utils import collect_consts
+
+
+class TestCcaCopa(unittest.TestCase):
+    def create(self, D: int, horizon=None):
+        c = ModelConfig.default()
+        c.T = 9
+        c.D = D
+        c.cca = "copa"
+        c.calculate_qdel = True
+        c.horizon = horizon
+        s, v = make_solver(c)
+        return (c, s, v)
+
+    def test_reachable_lags(self):
+        # incr/decr_allowed only exist for lags qdel can take
+        for D in [1, 3]:
+            for horizon in [None, 4]:
+                c, s, v = self.create(D, horizon)
+                consts = set(collect_consts(s.assertions()))
+                for t in range(c.T):
+                    for dt in range(c.T):
+                        active = t - c.R - c.D >= 0 and dt < c.look_back()
+                        self.assertEqual(
+                            f"incr_allowed_0,{t},{dt}" in consts,
+                            active and dt <= t - c.R)
+                        self.assertEqual(
+                            f"decr_allowed_0,{t},{dt}" in consts,
+                            active and dt <= t - c.R - 1)
+
+    def test_jitter_window(self):
+        # With D > 1, decreasing is allowed based on the delay at any of the D
+        # timesteps before t-R, with one qdel term per timestep
+        c, s, v = self.create(3)
+        defs = {}
+        for a in s.assertions():
+            consts = collect_consts([a])
+            names = [x for x in consts if x.startswith("decr_allowed_")]
+            if len(names) == 1 and str(a.arg(0)) == names[0]:
+                defs[names[0]] = [x for x in consts if x.startswith("qdel_")]
+        t, dt = 7, 1
+        self.assertEqual(sorted(defs[f"decr_allowed_0,{t},{dt}"]),
+                         [f"qdel_{u},{dt}" for u in range(t - c.R - c.D,
+                                                           t - c.R)])
+
+    def test_jitter_sat(self):
+        for D in [1, 2, 3]:
+            c, s, v = self.create(D)
+            s.add(And(v.L[0] == 0, v.S[-1] - v.S[0] > 0.5 * c.C * c.T))
+            self.assertEqual(str(s.check()), "sat")
+
+
+if __name__ == '__main__':
+    unittest.main()
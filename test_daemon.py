@@ -0,0 +1,105 @@
+from collections import OrderedDict
+from multiprocessing import AuthenticationError, Process
+from multiprocessing.connection import Client
+import os
+import stat
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import daemon
+from cache import cfg_key
+from config import ModelConfig
+from daemon import (default_address, handle, key_file, query, serve,
+                    to_smt2_fragment)
+from model import make_solver
+
+
+def service_bound(c: ModelConfig, bound: float) -> str:
+    ''' A fragment that is sat iff bound > 0 '''
+    s, v = make_solver(c)
+    return to_smt2_fragment(v.S[-1] - v.S[0] < bound)
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.c = ModelConfig.default()
+        self.c.T = 3
+
+    def test_query(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        address = os.path.join(tmp.name, "daemon.sock")
+        proc = Process(target=serve, args=(address, 1))
+        proc.start()
+        self.addCleanup(proc.join)
+        self.addCleanup(proc.terminate)
+        for _ in range(100):
+            if os.path.exists(address):
+                break
+            time.sleep(0.1)
+
+        qres = query(self.c, service_bound(self.c, 1), address=address)
+        self.assertEqual(qres.satisfiable, "sat")
+        self.assertLess(qres.model["tot_service_2"]
+                        - qres.model["tot_service_0"], 1)
+        # The same base model answers queries with different constraints
+        qres = query(self.c, service_bound(self.c, -1), address=address)
+        self.assertEqual(qres.satisfiable, "unsat")
+
+        # Errors in the worker are reported to the client, and the worker
+        # keeps serving
+        with self.assertRaises(RuntimeError):
+            query(self.c, "(assert (< no_such_var 1.0))", address=address)
+        qres = query(self.c, service_bound(self.c, 1), address=address)
+        self.assertEqual(qres.satisfiable, "sat")
+
+        # Only the owner can read the key, and clients without it are
+        # turned away before anything is unpickled
+        self.assertEqual(stat.S_IMODE(os.stat(key_file(address)).st_mode),
+                         0o600)
+        with self.assertRaises(AuthenticationError):
+            Client(address, family="AF_UNIX", authkey=b"wrong key")
+        conn = Client(address, family="AF_UNIX")
+        conn.send((self.c, service_bound(self.c, 1), 10))
+        self.assertTrue(conn.recv_bytes().startswith(b"#CHALLENGE#"))
+        conn.close()
+        qres = query(self.c, service_bound(self.c, 1), address=address)
+        self.assertEqual(qres.satisfiable, "sat")
+
+    def test_default_address(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with mock.patch.dict(os.environ, {"XDG_RUNTIME_DIR": tmp.name}):
+            folder = os.path.dirname(default_address())
+            self.assertEqual(os.path.dirname(folder), tmp.name)
+            self.assertEqual(stat.S_IMODE(os.stat(folder).st_mode), 0o700)
+            # Refuse a directory that others can access
+            os.chmod(folder, 0o755)
+            with self.assertRaises(RuntimeError):
+                default_address()
+
+    def test_base_models(self):
+        bases: "OrderedDict[str, daemon.BaseModel]" = OrderedDict()
+        cfgs = []
+        for T in [3, 4, 5]:
+            c = ModelConfig.default()
+            c.T = T
+            cfgs.append(c)
+        with mock.patch.object(daemon, "MAX_BASE_MODELS", 2), \
+                mock.patch.object(daemon, "BaseModel",
+                                  wraps=daemon.BaseModel) as base_model:
+            handle(bases, (cfgs[0], service_bound(cfgs[0], 1), 10))
+            handle(bases, (cfgs[1], service_bound(cfgs[1], 1), 10))
+            # Base models are reused and dropped least recently used first
+            qres = handle(bases, (cfgs[0], service_bound(cfgs[0], -1), 10))
+            self.assertEqual(qres.satisfiable, "unsat")
+            self.assertEqual(base_model.call_count, 2)
+            handle(bases, (cfgs[2], service_bound(cfgs[2], 1), 10))
+            self.assertEqual(list(bases.keys()),
+                             [cfg_key(cfgs[0]), cfg_key(cfgs[2])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import unittest
+from unittest import mock
+import z3
+from z3 import And
+
+from config import ModelConfig
+import invariants
+from invariants import INVARIANTS, Invariant, prove_invariants
+from model import make_solver
+from test_cache import TempCacheTestCase
+
+
+class TestInvariants(TempCacheTestCase):
+    def test_proven(self):
+        for (buf_min, buf_max, compose, N) in [
+                (None, None, True, 1), (1, 1, True, 1), (1, 2, False, 1),
+                (None, 1, True, 2)]:
+            c = ModelConfig.default()
+            c.T = 6
+            c.N = N
+            c.buf_min = buf_min
+            c.buf_max = buf_max
+            c.compose = compose
+            c.calculate_qdel = N > 1
+            res = prove_invariants(c)
+            for inv in INVARIANTS:
+                self.assertEqual(res[inv.name], "unsat")
+
+    def test_false_invariant(self):
+        # The queue can be non-empty, so this must not be proven
+        bogus = Invariant(
+            "empty_queue", lambda c, v: [v.queue[t] <= 0 for t in range(c.T)])
+        c = ModelConfig.default()
+        c.T = 6
+        c.cca = "aimd"
+        c.invariants = True
+        with mock.patch.object(invariants, "INVARIANTS",
+                               INVARIANTS + [bogus]):
+            res = prove_invariants(c)
+            self.assertEqual(res["empty_queue"], "sat")
+            s, v = make_solver(c)
+            s.add(v.queue[-1] > 0)
+            self.assertEqual(str(s.check()), "sat")
+
+    def test_same_result(self):
+        # Adding the invariants does not change the answer, and the proofs
+        # are cached
+        for thresh in [0.1, 0.9]:
+            res = []
+            for inv in [False, True]:
+                c = ModelConfig.default()
+                c.T = 8
+                c.cca = "aimd"
+                c.buf_min = 1
+                c.buf_max = 1
+                c.invariants = inv
+                s, v = make_solver(c)
+                s.add(And(v.L[0] == 0, v.S[-1] - v.S[0] < thresh * c.C * c.T))
+                res.append(str(s.check()))
+            self.assertEqual(res[0], res[1])
+        with mock.patch.object(z3.Solver, "check",
+                               side_effect=AssertionError):
+            prove_invariants(c)
+
+    def test_stale(self):
+        # A proof is not reused for a different invariant of the same name,
+        # or for a different model
+        c = ModelConfig.default()
+        c.T = 6
+        self.assertEqual(prove_invariants(c)["service_le_accepted"], "unsat")
+        bogus = Invariant(
+            "service_le_accepted",
+            lambda c, v: [v.queue[t] <= 0 for t in range(c.T)])
+        with mock.patch.object(invariants, "INVARIANTS", [bogus]):
+            self.assertEqual(prove_invariants(c)["service_le_accepted"],
+                             "sat")
+        n_proofs = len(os.listdir(self.tmp.name))
+        with mock.patch("model.monotone", lambda c, s, v: None):
+            prove_invariants(c)
+        self.assertGreater(len(os.listdir(self.tmp.name)), n_proofs)
+
+    def test_unreadable(self):
+        c = ModelConfig.default()
+        c.T = 6
+        prove_invariants(c)
+        for fname in os.listdir(self.tmp.name):
+            with open(os.path.join(self.tmp.name, fname), "wb") as f:
+                f.write(b"not a pickle")
+        res = prove_invariants(c)
+        for inv in INVARIANTS:
+            self.assertEqual(res[inv.name], "unsat")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,10 @@
+from copy import copy
 import unittest
-from z3 import And, Implies, Or
+from z3 import And, Implies, Not, Or, Solver, is_false
 
 from config import ModelConfig
-from model import Variables, calculate_qdel, initial, monotone, make_solver, \
-    network, relate_tot
+from model import Variables, calculate_qdel, initial, loss_detected, \
+    monotone, make_solver, multi_flows, network, relate_tot
 from pyz3_utils import MySolver
 
 
@@ -59,8 +60,15 @@ class TestModel(unittest.TestCase):
         self.assertEqual(str(sat), "sat")
 
     def test_cca_const(self):
-        c = ModelConfig.default()
-        c.cca = "const"
+        for fold in [False, True]:
+            for pacing in [False, True]:
+                c = ModelConfig.default()
+                c.cca = "const"
+                c.fold_constants = fold
+                c.pacing = pacing
+                self.check_cca_const(c)
+
+    def check_cca_const(self, c: ModelConfig):
         for cwnd in [c.C * c.R / 2, c.C * c.R, 2 * c.C * c.R, 3 * c.C * c.R]:
             util_bound = max((c.T-1) * cwnd / (c.R + c.D), c.T*c.C)
             c.alpha = cwnd
@@ -77,6 +85,17 @@ class TestModel(unittest.TestCase):
             sat = s.check()
             self.assertEqual(str(sat), "sat")
 
+    def test_single_flow(self):
+        # With one flow, the per-flow and total variables are the same
+        c = ModelConfig.default()
+        c.N = 1
+        s, v = make_solver(c)
+        self.assertIs(v.A_f[0], v.A)
+        self.assertIs(v.S_f[0], v.S)
+        self.assertIs(v.L_f[0], v.L)
+        s.add(v.S_f[0][c.T-1] - v.S[0] > c.C * c.T)
+        self.assertEqual(str(s.check()), "unsat")
+
     def test_qdel(self):
         c = ModelConfig.default()
         c.calculate_qdel = True
@@ -106,6 +125,148 @@ class TestModel(unittest.TestCase):
 
         self.assertEqual(str(sat), "unsat")
 
+    def test_qdel_triangular(self):
+        # Bytes cannot have been input before t=0, so only entries with
+        # dt <= t are variables
+        for horizon in [None, 3]:
+            c = ModelConfig.default()
+            c.calculate_qdel = True
+            c.horizon = horizon
+            v = Variables(c, MySolver())
+            for t in range(c.T):
+                for dt in range(c.look_back()):
+                    self.assertEqual(is_false(v.qdel[t][dt]), dt > t)
+                if horizon is not None:
+                    self.assertEqual(is_false(v.qdel_old[t]), t <= horizon)
+
+    def test_loss_detected_linear(self):
+        # The linear encoding of loss_detected must allow exactly the same
+        # behaviors as the quadratic one
+        def create(R: int):
+            c = ModelConfig.default()
+            c.T = 6
+            c.R = R
+            # Otherwise there is no loss to detect
+            c.buf_min = 1
+            c.buf_max = 1
+            s = MySolver()
+            v = Variables(c, s)
+            monotone(c, s, v)
+            initial(c, s, v)
+            relate_tot(c, s, v)
+            network(c, s, v)
+            return (c, s, v)
+
+        def encode(c: ModelConfig, s: MySolver, v: Variables, encoding: str):
+            c.loss_encoding = encoding
+            # v's variables are declared in `s`. The linear encoding declares
+            # its own, so they must end up declared in `s` too
+            scratch = MySolver()
+            scratch.variables = s.variables
+            loss_detected(c, scratch, v)
+            return scratch.assertions()
+
+        for R in [1, 2]:
+            # Linear implies quadratic
+            c, s, v = create(R)
+            s.add(And(encode(c, s, v, "linear")))
+            s.add(Not(And(encode(c, s, v, "quadratic"))))
+            self.assertEqual(str(s.check()), "unsat")
+
+            # Quadratic implies linear, given that the auxiliary detection
+            # indices take their (always existing) defined values
+            c, s, v = create(R)
+            lin = encode(c, s, v, "linear")
+            s.add(And(encode(c, s, v, "quadratic")))
+            s.add(And([a for a in lin if "loss_detected_" not in str(a)]))
+            s.add(Not(And([a for a in lin if "loss_detected_" in str(a)])))
+            self.assertEqual(str(s.check()), "unsat")
+
+    def test_qdel_int(self):
+        # The int encoding of qdel must allow exactly the same behaviors as
+        # the bool encoding
+        def create(N: int, encoding: str):
+            c = ModelConfig.default()
+            c.T = 5
+            c.N = N
+            c.calculate_qdel = True
+            c.qdel_encoding = encoding
+            s = MySolver()
+            v = Variables(c, s)
+            monotone(c, s, v)
+            initial(c, s, v)
+            relate_tot(c, s, v)
+            network(c, s, v)
+            return (c, s, v)
+
+        def encode(c: ModelConfig, v: Variables):
+            # v's variables are declared in another MySolver
+            s = Solver()
+            calculate_qdel(c, s, v)
+            if c.N > 1:
+                multi_flows(c, s, v)
+            return s.assertions()
+
+        for N in [1, 2]:
+            for direction in ["int_implies_bool", "bool_implies_int"]:
+                c, s, vb = create(N, "bool")
+                ci = copy(c)
+                ci.qdel_encoding = "int"
+                # Same names as vb, except for the int encoding's qdel_idx
+                vi = Variables(ci, s)
+                # Tie the Booleans to the int encoding
+                s.add(And([And(vi.qdel_idx[t] >= -1, vi.qdel_idx[t] <= t)
+                           for t in range(c.T)]))
+                s.add(And([vb.qdel[t][dt] == vi.qdel[t][dt]
+                           for t in range(c.T) for dt in range(c.T)]))
+                enc_bool = encode(c, vb)
+                enc_int = encode(ci, vi)
+
+                if direction == "int_implies_bool":
+                    s.add(And(enc_int))
+                    s.add(Not(And(enc_bool)))
+                else:
+                    # Given the definitions of the auxiliary functions
+                    s.add(And(enc_bool))
+                    s.add(And([a for a in enc_int
+                               if "qdel_idx" not in str(a)]))
+                    s.add(Not(And(enc_int)))
+                self.assertEqual(str(s.check()), "unsat")
+
+    def test_qdel_horizon(self):
+        # With a horizon, calculate_qdel must allow every behavior it allows
+        # without one
+        H = 3
+        c = ModelConfig.default()
+        c.T = 7
+        c.calculate_qdel = True
+        s = MySolver()
+        v = Variables(c, s)
+        monotone(c, s, v)
+        initial(c, s, v)
+        relate_tot(c, s, v)
+        network(c, s, v)
+        calculate_qdel(c, s, v)
+
+        ch = ModelConfig.default()
+        ch.T = c.T
+        ch.horizon = H
+        ch.calculate_qdel = True
+        vh = Variables(ch, s, name="horizon")
+        for t in range(c.T):
+            s.add(vh.A[t] == v.A[t])
+            s.add(vh.L[t] == v.L[t])
+            s.add(vh.S[t] == v.S[t])
+            for dt in range(H):
+                s.add(vh.qdel[t][dt] == v.qdel[t][dt])
+            s.add(vh.qdel_old[t] == Or([v.qdel[t][dt]
+                                        for dt in range(H, c.T)]))
+        # vh's variables are declared in `s`
+        sh = Solver()
+        calculate_qdel(ch, sh, vh)
+        s.add(Not(And(sh.assertions())))
+        self.assertEqual(str(s.check()), "unsat")
+
 
 if __name__ == '__main__':
     unittest.main()
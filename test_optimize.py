@@ -0,0 +1,72 @@
+from fractions import Fraction
+import unittest
+
+from config import ModelConfig
+from model import make_solver
+from optimize import optimize_bound
+from pyz3_utils import MySolver
+
+
+class TestOptimize(unittest.TestCase):
+    def test_real(self):
+        s = MySolver()
+        x = s.Real("x")
+        s.add(x >= 1.5)
+        s.add(x < 5)
+        c = ModelConfig.default()
+
+        # Z3 returns Int numerals for integral bounds
+        ores = optimize_bound(c, s, None, x, maximize=True)
+        self.assertEqual(ores.satisfiable, "sat")
+        self.assertEqual(ores.value, 5)
+        self.assertFalse(ores.attained)
+        self.assertLess(ores.model["x"], 5)
+
+        ores = optimize_bound(c, s, None, x)
+        self.assertEqual(ores.value, Fraction(3, 2))
+        self.assertTrue(ores.attained)
+        self.assertEqual(ores.model["x"], Fraction(3, 2))
+
+        ores = optimize_bound(c, s, None, -x)
+        self.assertFalse(ores.unbounded)
+        self.assertEqual(ores.value, -5)
+        s.add(x > 10)
+        self.assertEqual(optimize_bound(c, s, None, x).satisfiable, "unsat")
+
+    def test_unbounded(self):
+        s = MySolver()
+        x = s.Real("x")
+        s.add(x >= 0)
+        ores = optimize_bound(ModelConfig.default(), s, None, x,
+                              maximize=True)
+        self.assertEqual(ores.satisfiable, "sat")
+        self.assertTrue(ores.unbounded)
+        self.assertIsNone(ores.value)
+
+    def test_make_solver(self):
+        c = ModelConfig.default()
+        c.T = 6
+        for (w0, expected) in [(False, 6), (True, 5)]:
+            s, v = make_solver(c)
+            if w0:
+                # Without wastage before t=0, the link can serve C per
+                # timestep. Otherwise it can serve C*D more
+                s.add(v.W[0] == 0)
+            ores = optimize_bound(c, s, v, v.S[-1] - v.S[0], maximize=True)
+            self.assertEqual(ores.value, expected * c.C)
+            self.assertTrue(ores.attained)
+            self.assertEqual(ores.model[f"tot_service_{c.T - 1}"]
+                             - ores.model["tot_service_0"], ores.value)
+
+        # cwnd must be positive, so some bytes are served, but arbitrarily
+        # few
+        s, v = make_solver(c)
+        ores = optimize_bound(c, s, v, v.S[-1] - v.S[0])
+        self.assertEqual(ores.value, 0)
+        self.assertFalse(ores.attained)
+        self.assertGreater(ores.model[f"tot_service_{c.T - 1}"]
+                           - ores.model["tot_service_0"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
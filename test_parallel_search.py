@@ -0,0 +1,74 @@
+import unittest
+
+from config import ModelConfig
+from model import make_solver
+from parallel_search import KarySearch, find_bound_parallel
+from pyz3_utils import BinarySearch
+from test_cache import TempCacheTestCase
+from utils import find_bound
+
+
+def max_service_cons(c: ModelConfig, thresh: float):
+    ''' Sat iff thresh <= C*(T-1+D), the maximum service in T-1 timesteps.
+    Module-level, so worker processes can run it '''
+    s, v = make_solver(c)
+    s.add(v.S[-1] - v.S[0] >= thresh)
+    return (s, v)
+
+
+class TestKarySearch(unittest.TestCase):
+    def test_next_pt(self):
+        search = KarySearch(0, 8, 1, k=3)
+        self.assertEqual(search.next_pt(), 4)
+        # Pending points split the bracket, and the widest part is split next
+        self.assertEqual(search.next_pt([4]), 2)
+        self.assertEqual(search.next_pt([2, 4]), 6)
+        self.assertEqual(search.next_pt([2, 4, 6]), 1)
+
+    def test_gaps(self):
+        search = KarySearch(0, 8, 1, k=3)
+        search.register_pt(4, 1)
+        search.register_pt(6, 2)
+        self.assertEqual(search.gaps(), [(4, 6), (6, 8)])
+        self.assertEqual(search.get_bounds(), (4, (6, 6), 8))
+
+        # Gaps narrower than err are done
+        search.register_pt(7, 3)
+        self.assertEqual(search.gaps(), [(4, 6)])
+        self.assertTrue(search.relevant(5))
+        self.assertFalse(search.relevant(6.5))
+        self.assertFalse(search.relevant(3))
+
+        # Results beyond the unknown region make it irrelevant
+        search.register_pt(5, 3)
+        self.assertEqual(search.get_bounds(), (4, None, 5))
+        self.assertIsNone(search.next_pt())
+
+        # Stale results never widen the bracket
+        search.register_pt(2, 1)
+        search.register_pt(7.5, 3)
+        self.assertEqual(search.get_bounds(), (4, None, 5))
+
+
+class TestFindBoundParallel(TempCacheTestCase):
+    def test_find_bound(self):
+        c = ModelConfig.default()
+        c.T = 6
+        best = c.C * (c.T - 1 + c.D)
+        for k in [1, 3]:
+            lo, unknown, hi = find_bound_parallel(
+                max_service_cons, c, KarySearch(0, 10, 0.1, k), timeout=10)
+            self.assertIsNone(unknown)
+            self.assertLessEqual(lo, best)
+            self.assertLess(best, hi)
+            self.assertLessEqual(hi - lo, 0.1)
+
+        # Agrees with the sequential search
+        seq = find_bound(max_service_cons, c, BinarySearch(0, 10, 0.1),
+                         timeout=10)
+        self.assertLessEqual(seq[0], hi)
+        self.assertLessEqual(lo, seq[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
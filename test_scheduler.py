@@ -0,0 +1,98 @@
+import unittest
+from unittest import mock
+
+import cache
+import scheduler
+from cache import QueryResult
+from config import ModelConfig
+from model import make_solver
+from scheduler import first_timeout, run_batch
+from test_cache import TempCacheTestCase
+
+
+class FakeSolver:
+    ''' Stands in for cache.solve. Query i is decided only with a timeout of
+    at least needs[i] seconds (or runs out of memory if that is None), and
+    advances a fake clock by the time it takes '''
+    def __init__(self, queries, needs):
+        self.needs = {id(s): need for ((_, s, _), need) in zip(queries, needs)}
+        self.ids = {id(s): i for (i, (_, s, _)) in enumerate(queries)}
+        self.clock = 0.0
+        self.calls = []
+
+    def time(self) -> float:
+        return self.clock
+
+    def solve(self, c, s, v, timeout, *args) -> QueryResult:
+        self.calls.append((self.ids[id(s)], timeout))
+        need = self.needs[id(s)]
+        if need is None:
+            self.clock += 1
+            return QueryResult("unknown", None, c, None, timeout, 1,
+                               reason="memory")
+        if need > timeout:
+            self.clock += timeout
+            return QueryResult("unknown", None, c, None, timeout, timeout,
+                               reason="timeout")
+        self.clock += need
+        return QueryResult("sat", {}, c, None, timeout, need)
+
+
+def make_queries(n: int):
+    queries = []
+    for i in range(n):
+        c = ModelConfig.default()
+        c.T = 3
+        s, v = make_solver(c)
+        s.add(v.S[-1] - v.S[0] < i + 1)
+        queries.append((c, s, v))
+    return queries
+
+
+class TestScheduler(TempCacheTestCase):
+    def run_batch(self, queries, needs, **kwargs):
+        fake = FakeSolver(queries, needs)
+        with mock.patch.object(cache, "solve", side_effect=fake.solve), \
+                mock.patch.object(scheduler.time, "time",
+                                  side_effect=fake.time):
+            results = run_batch(queries, initial_timeout=10, factor=4,
+                                **kwargs)
+        return (results, fake)
+
+    def test_escalate(self):
+        queries = make_queries(3)
+        results, fake = self.run_batch(queries, [5, 30, 1000], budget=200)
+        # Unknowns are retried with timeouts 4x larger, until the next attempt
+        # would exceed the budget (95s spent + 160s > 200s)
+        self.assertEqual(fake.calls, [(0, 10), (1, 10), (2, 10),
+                                      (1, 40), (2, 40)])
+        self.assertEqual([r.satisfiable for r in results],
+                         ["sat", "sat", "unknown"])
+        self.assertEqual(fake.clock, 95)
+
+        # The next run continues where this one stopped
+        c, s, _ = queries[2]
+        qres, timeout = first_timeout(c, s, 10, 4)
+        self.assertEqual((qres.satisfiable, timeout), ("unknown", 160))
+        results, fake = self.run_batch(queries, [5, 30, 100], budget=200)
+        self.assertEqual(fake.calls, [(2, 160)])
+        self.assertEqual([r.satisfiable for r in results], ["sat"] * 3)
+
+    def test_budget(self):
+        # Queries that do not fit in the budget are not run at all
+        results, fake = self.run_batch(make_queries(3), [5, 5, 5], budget=15)
+        self.assertEqual(fake.calls, [(0, 10), (1, 10)])
+        self.assertEqual([r.satisfiable for r in results[:2]], ["sat"] * 2)
+        self.assertIsNone(results[2])
+
+    def test_memory(self):
+        # Running out of memory is not retried with a longer timeout
+        results, fake = self.run_batch(make_queries(2), [None, 30],
+                                       budget=200)
+        self.assertEqual(fake.calls, [(0, 10), (1, 10), (1, 40)])
+        self.assertEqual(results[0].reason, "memory")
+        self.assertEqual(results[1].satisfiable, "sat")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from unittest import mock
+from z3 import And, Solver
+
+from cache import run_query
+from config import ModelConfig
+from model import make_solver
+from slicing import run_sliced, slice_query
+from test_cache import TempCacheTestCase
+
+
+class TestSlicing(TempCacheTestCase):
+    def create(self, cca: str):
+        c = ModelConfig.default()
+        c.T = 10
+        c.cca = cca
+        c.calculate_qdel = True
+        s, v = make_solver(c)
+        return (c, s, v)
+
+    def test_slice_query(self):
+        for cca in ["aimd", "copa", "bbr"]:
+            c, s, v = self.create(cca)
+            # Only the first few timesteps matter for this query, which is
+            # impossible since the link cannot serve more than C per timestep
+            query = [v.S[3] - v.S[0] > 4 * c.C + c.C * c.D]
+            s.add(And(query))
+            sliced, report = slice_query(c, s, v, query)
+
+            full = [str(a) for a in s.assertions()]
+            for a in sliced:
+                self.assertIn(str(a), full)
+            self.assertEqual(report.t_max, 3)
+            self.assertEqual(report.kept_assertions, len(sliced))
+            self.assertEqual(report.total_assertions, len(full))
+            self.assertLess(report.kept_assertions, report.total_assertions)
+            self.assertLess(report.kept_vars, report.total_vars)
+
+            ss = Solver()
+            ss.add(*sliced)
+            self.assertEqual(str(ss.check()), "unsat")
+
+    def test_slice_whole_trace(self):
+        # A query about the last timestep can only prune constraints that are
+        # disconnected from it
+        c, s, v = self.create("aimd")
+        query = [v.S[-1] - v.S[0] < 0.1 * c.C * c.T]
+        s.add(And(query))
+        sliced, report = slice_query(c, s, v, query)
+        self.assertEqual(report.t_max, c.T - 1)
+        ss = Solver()
+        ss.add(*sliced)
+        self.assertEqual(str(ss.check()), str(s.check()))
+
+    def test_run_sliced(self):
+        # An unsat slice is the answer, so the full query is not solved
+        c, s, v = self.create("aimd")
+        query = [v.S[3] - v.S[0] > 4 * c.C + c.C * c.D]
+        s.add(And(query))
+        with mock.patch("slicing.run_query", wraps=run_query) as rq:
+            self.assertEqual(run_sliced(c, s, v, query).satisfiable, "unsat")
+            self.assertEqual(rq.call_count, 1)
+            self.assertLess(len(rq.call_args[0][1].assertions()),
+                            len(s.assertions()))
+
+        # A sat slice is inconclusive, so we fall back to the full query
+        c, s, v = self.create("aimd")
+        query = [v.S[3] - v.S[0] > 0.5 * c.C]
+        s.add(And(query))
+        with mock.patch("slicing.run_query", wraps=run_query) as rq:
+            qres = run_sliced(c, s, v, query)
+            self.assertEqual(rq.call_count, 2)
+            self.assertIs(rq.call_args[0][1], s)
+        self.assertEqual(qres.satisfiable, "sat")
+        self.assertIn(f"tot_service_{c.T - 1}", qres.model)
+
+
+if __name__ == '__main__':
+    unittest.main()
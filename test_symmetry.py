@@ -0,0 +1,77 @@
+from contextlib import redirect_stdout
+import io
+import unittest
+from z3 import And, Bool
+
+from config import ModelConfig
+from model import make_solver
+from symmetry import break_symmetry, is_symmetric
+
+
+class TestSymmetry(unittest.TestCase):
+    def create(self, N: int):
+        c = ModelConfig.default()
+        c.N = N
+        c.T = 6
+        c.cca = "aimd"
+        c.calculate_qdel = True
+        s, v = make_solver(c)
+        return (c, s, v)
+
+    def test_is_symmetric(self):
+        c, s, v = self.create(3)
+        # Total utilization does not depend on the order of the flows
+        self.assertTrue(is_symmetric(
+            c, v, [v.S[-1] - v.S[0] < 0.5 * c.C * c.T]))
+        self.assertTrue(is_symmetric(
+            c, v, [And([v.S_f[n][-1] > v.S_f[n][0] for n in range(c.N)])]))
+        # Unfairness towards flow 0 does
+        self.assertFalse(is_symmetric(
+            c, v, [v.S_f[0][-1] - v.S_f[0][0] < 0.1 * c.C * c.T]))
+        self.assertFalse(is_symmetric(
+            c, v, [v.S_f[0][-1] < v.S_f[1][-1],
+                   v.S_f[1][-1] < v.S_f[2][-1]]))
+        # We don't know how to permute CCA-internal variables
+        self.assertFalse(is_symmetric(c, v, [Bool("aimd_incr_0,3")]))
+
+    def test_break_symmetry(self):
+        # Symmetry breaking must not change the answer to a symmetric query
+        for thresh in [0.1, 0.9]:
+            res = []
+            for sym in [False, True]:
+                c, s, v = self.create(2)
+                query = [v.S[-1] - v.S[0] < thresh * c.C * c.T,
+                         v.L[0] == 0]
+                s.add(And(query))
+                if sym:
+                    self.assertTrue(break_symmetry(c, s, v, query))
+                res.append(str(s.check()))
+            self.assertEqual(res[0], res[1])
+
+        # Asymmetric queries are left alone
+        c, s, v = self.create(2)
+        query = [v.S_f[0][-1] > v.S_f[1][-1]]
+        s.add(And(query))
+        n_asserts = len(s.assertions())
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self.assertFalse(break_symmetry(c, s, v, query))
+        self.assertIn("not symmetric", out.getvalue())
+        self.assertEqual(len(s.assertions()), n_asserts)
+        self.assertEqual(str(s.check()), "sat")
+
+        # A single flow has no symmetry to break, and is not reported as
+        # asymmetric
+        c, s, v = self.create(1)
+        query = [v.S[-1] - v.S[0] < 0.1 * c.C * c.T]
+        s.add(And(query))
+        n_asserts = len(s.assertions())
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self.assertFalse(break_symmetry(c, s, v, query))
+        self.assertEqual(out.getvalue(), "")
+        self.assertEqual(len(s.assertions()), n_asserts)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+from config import ModelConfig
+from model import make_solver
+from pyz3_utils import BinarySearch
+from test_cache import TempCacheTestCase
+from utils import find_bound, find_bound_incremental
+
+
+class TestFindBound(TempCacheTestCase):
+    def test_incremental(self):
+        # The maximum service in T-1 timesteps is C*(T-1) + C*D, since there
+        # may have been wastage before t=0
+        c = ModelConfig.default()
+        c.T = 6
+        best = c.C * (c.T - 1 + c.D)
+
+        def model_cons(c: ModelConfig, thresh: float):
+            s, v = make_solver(c)
+            s.add(v.S[-1] - v.S[0] >= thresh)
+            return (s, v)
+
+        bounds = find_bound(model_cons, c, BinarySearch(0, 10, 0.1),
+                            timeout=10)
+
+        s, v = make_solver(c)
+        bounds_inc = find_bound_incremental(
+            lambda thresh: v.S[-1] - v.S[0] >= thresh, s,
+            BinarySearch(0, 10, 0.1), timeout=10)
+
+        self.assertEqual(bounds, bounds_inc)
+        lo, unknown, hi = bounds
+        self.assertIsNone(unknown)
+        self.assertLessEqual(lo, best)
+        self.assertLess(best, hi)
+        self.assertLessEqual(hi - lo, 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
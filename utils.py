@@ -1,9 +1,10 @@
 from fractions import Fraction
-from typing import Callable, Dict, Union
+from typing import Callable, Dict, List, Tuple, Union
 import z3
 
 from config import ModelConfig
-from pyz3_utils import BinarySearch, MySolver
+from pyz3_utils import BinarySearch, MySolver, sat_to_val
+from variables import Variables
 
 ModelDict = Dict[str, Union[Fraction, bool]]
 
@@ -14,6 +15,10 @@ def model_to_dict(model: z3.ModelRef) -> ModelDict:
     decls = model.decls()
     res: Dict[str, Union[float, bool]] = {}
     for d in decls:
+        if d.arity() > 0:
+            # Uninterpreted functions are auxiliary. Their values are also
+            # available through the variables they are tied to
+            continue
         val = model[d]
         if type(val) == z3.BoolRef:
             res[d.name()] = bool(val)
@@ -25,6 +30,23 @@ def model_to_dict(model: z3.ModelRef) -> ModelDict:
     return res
 
 
+def collect_consts(exprs: List[z3.ExprRef]) -> Dict[str, z3.FuncDeclRef]:
+    ''' Declarations of all the variables that appear in `exprs` '''
+    res: Dict[str, z3.FuncDeclRef] = {}
+    seen = set()
+    stack = list(exprs)
+    while len(stack) > 0:
+        e = stack.pop()
+        if e.get_id() in seen:
+            continue
+        seen.add(e.get_id())
+        if z3.is_const(e) and e.decl().kind() == z3.Z3_OP_UNINTERPRETED:
+            res[e.decl().name()] = e.decl()
+        else:
+            stack.extend(e.children())
+    return res
+
+
 def make_periodic(c, s, v, dur: int):
     '''A utility function that makes the solution periodic. A periodic solution
     means the same pattern can repeat indefinitely. If we don't make it
@@ -38,28 +60,72 @@ def make_periodic(c, s, v, dur: int):
     conditions. For AIMD dur=1, for Copa dur=c.R+c.D, for BBR dur=2*c.R
 
     '''
-    s.add(v.A[-1] - v.L[-1] - (c.C * (c.T - 1) - v.W[-1]) == v.A[0] - v.L[0] -
-          (-v.W[0]))
+    s.add(v.acc[-1] - v.bound[-1] == v.acc[0] - v.bound[0])
     for n in range(c.N):
-        s.add(v.A_f[n][-1] - v.L_f[n][-1] - v.S_f[n][-1] == v.A_f[n][0] -
-              v.L_f[n][0] - v.S_f[n][0])
+        s.add(v.acc_f[n][-1] - v.S_f[n][-1] == v.acc_f[n][0] - v.S_f[n][0])
         s.add(v.L_f[n][-1] - v.Ld_f[n][-1] == v.L_f[n][0] - v.Ld_f[n][0])
         for dt in range(dur):
             s.add(v.c_f[n][c.T - 1 - dt] == v.c_f[n][dur - 1 - dt])
             s.add(v.r_f[n][c.T - 1 - dt] == v.r_f[n][dur - 1 - dt])
 
 
-def find_bound(model_cons: Callable[[ModelConfig, float], MySolver],
+def find_bound(model_cons: Callable[[ModelConfig, float],
+                                    Tuple[MySolver, Variables]],
                cfg: ModelConfig, search: BinarySearch, timeout: float):
+    '''Find the threshold at which the query returned by `model_cons` goes
+    from sat to unsat. If `search` is a parallel_search.KarySearch, several
+    thresholds are tested at once in worker processes
+
+    '''
+    # Imported here since these modules depend on this one
+    from cache import run_query
+    from parallel_search import KarySearch, find_bound_parallel
+
+    if isinstance(search, KarySearch):
+        return find_bound_parallel(model_cons, cfg, search, timeout)
+
     while True:
         thresh = search.next_pt()
         if thresh is None:
             break
-        s = model_cons(cfg, thresh)
+        s, v = model_cons(cfg, thresh)
 
         print(f"Testing threshold = {thresh}")
-        qres = cache.run_query(s, cfg, timeout=timeout)
+        qres = run_query(cfg, s, v, timeout=timeout)
 
         print(qres.satisfiable)
         search.register_pt(thresh, sat_to_val(qres.satisfiable))
     return search.get_bounds()
+
+
+def find_bound_incremental(thresh_cons: Callable[[float], z3.BoolRef],
+                           s: MySolver, search: BinarySearch, timeout: float,
+                           reverse: bool = False):
+    '''Like find_bound, but the base model `s` (e.g. from make_solver) is
+    built once. For each threshold, only `thresh_cons(thresh)` is added,
+    guarded by a fresh Boolean that is passed as an assumption to `check`.
+    Z3 keeps its learned lemmas between probes, so later probes are usually
+    faster than solving from scratch.
+
+    '''
+    solver = z3.Solver()
+    solver.add(s.assertions())
+    solver.set(timeout=int(timeout * 1000))
+
+    probe = 0
+    while True:
+        thresh = search.next_pt()
+        if thresh is None:
+            break
+
+        print(f"Testing threshold = {thresh}")
+        guard = z3.Bool(f"thresh_guard_{probe}")
+        probe += 1
+        solver.add(z3.Implies(guard, thresh_cons(thresh)))
+        satisfiable = str(solver.check(guard))
+        # Permanently disable this threshold's constraint so Z3 can discard it
+        solver.add(z3.Not(guard))
+
+        print(satisfiable)
+        search.register_pt(thresh, sat_to_val(satisfiable, reverse))
+    return search.get_bounds()
@@ -1,4 +1,5 @@
 from typing import Any, List, Optional, Tuple
+from z3 import ArithRef, BoolVal, RealVal
 
 from config import ModelConfig
 from pyz3_utils import MySolver
@@ -20,43 +21,78 @@ class Variables(pyz3_utils.Variables):
             pre = name + "__"
         self.pre = pre
 
+        # With fold_constants, variables that the CCA pins to a term are
+        # replaced by that term. See the end of this function
+        self.fold_cwnd = c.fold_constants and c.cca == "const"
+        self.fold_rate = c.fold_constants and (
+            c.cca in ["aimd", "copa"] or (c.cca == "const" and c.pacing))
+        self.fold_dupacks = c.fold_constants and c.cca == "aimd" \
+            and c.dupacks is None
+
         # Naming convention: X_f denotes per-flow values (note, we only study
-        # the single-flow case in the paper)
+        # the single-flow case in the paper). With a single flow, A_f, S_f and
+        # L_f are the same lists as the totals A, S and L (e.g. A_f[0] is A),
+        # so there are no duplicate variables to relate
 
-        # Cumulative number of bytes sent by flow n till time t
-        self.A_f = [[s.Real(f"{pre}arrival_{n},{t}") for t in range(T)]
-                    for n in range(c.N)]
         # Sum of A_f across all flows
         self.A = [s.Real(f"{pre}tot_arrival_{t}") for t in range(T)]
+        # Cumulative number of bytes sent by flow n till time t
+        if c.N == 1:
+            self.A_f = [self.A]
+        else:
+            self.A_f = [[s.Real(f"{pre}arrival_{n},{t}") for t in range(T)]
+                        for n in range(c.N)]
         # Congestion window for flow n at time t
-        self.c_f = [[s.Real(f"{pre}cwnd_{n},{t}") for t in range(T)]
-                    for n in range(c.N)]
+        if not self.fold_cwnd:
+            self.c_f = [[s.Real(f"{pre}cwnd_{n},{t}") for t in range(T)]
+                        for n in range(c.N)]
         # Pacing rate for flow n at time t
-        self.r_f = [[s.Real(f"{pre}rate_{n},{t}") for t in range(T)]
-                    for n in range(c.N)]
+        if not self.fold_rate:
+            self.r_f = [[s.Real(f"{pre}rate_{n},{t}") for t in range(T)]
+                        for n in range(c.N)]
         # Cumulative number of losses detected (by duplicate acknowledgements
         # or timeout) by flow n till time t
         self.Ld_f = [[s.Real(f"{pre}loss_detected_{n},{t}")
                       for t in range(T)]
                      for n in range(c.N)]
+        # Sum of S_f across all flows
+        self.S = [s.Real(f"{pre}tot_service_{t}") for t in range(T)]
         # Cumulative number of bytes served from the server for flow n till
         # time t. These acks corresponding to these bytes will reach the sender
         # at time t+c.R
-        self.S_f = [[s.Real(f"{pre}service_{n},{t}") for t in range(T)]
-                    for n in range(c.N)]
-        # Sum of S_f across all flows
-        self.S = [s.Real(f"{pre}tot_service_{t}") for t in range(T)]
-        # Cumulative number of bytes lost for flow n till time t
-        self.L_f = [[s.Real(f"{pre}losts_{n},{t}") for t in range(T)]
-                    for n in range(c.N)]
+        if c.N == 1:
+            self.S_f = [self.S]
+        else:
+            self.S_f = [[s.Real(f"{pre}service_{n},{t}") for t in range(T)]
+                        for n in range(c.N)]
         # Sum of L_f for all flows
         self.L = [s.Real(f"{pre}tot_lost_{t}") for t in range(T)]
+        # Cumulative number of bytes lost for flow n till time t
+        if c.N == 1:
+            self.L_f = [self.L]
+        else:
+            self.L_f = [[s.Real(f"{pre}losts_{n},{t}") for t in range(T)]
+                        for n in range(c.N)]
         # Cumulative number of bytes wasted by the server till time t
         self.W = [s.Real(f"{pre}wasted_{t}") for t in range(T)]
         # Whether or not flow n is timing out at time t
         self.timeout_f = [[s.Bool(f"{pre}timeout_{n},{t}") for t in range(T)]
                           for n in range(c.N)]
 
+        # Subterms that appear in many constraints. They are built once here
+        # and shared by all constraints, so Z3 sees a single term for each
+
+        # Cumulative number of bytes of flow n accepted into the queue (i.e.
+        # not lost) till time t
+        self.acc_f = [[self.A_f[n][t] - self.L_f[n][t] for t in range(T)]
+                      for n in range(c.N)]
+        # Sum of acc_f across all flows
+        self.acc = [self.A[t] - self.L[t] for t in range(T)]
+        # The maximum cumulative service till time t
+        self.bound = [c.C * t - self.W[t] for t in range(T)]
+        # Number of bytes in the queue at time t
+        self.queue = [self.acc[t] - self.S[t] for t in range(T)]
+
         # If qdel[t][dt] is true, it means that the bytes exiting at t were
         # input at time t - dt. If out[t] == out[t-1], then qdel[t][dt] ==
         # qdel[t-1][dt], since qdel isn't really defined (since no packets were
@@ -64,10 +100,31 @@ class Variables(pyz3_utils.Variables):
         # received packet.
 
         # This is only computed when calculate_qdel=True since not all CCAs
-        # require it. Of the CCAs implemented so far, only Copa requires it
-        if c.calculate_qdel:
-            self.qdel = [[s.Bool(f"{pre}qdel_{t},{dt}") for dt in range(T)]
+        # require it. Of the CCAs implemented so far, only Copa requires it.
+        # With a horizon H < T, qdel only has entries for dt < H and
+        # qdel_old[t] is true if the bytes were input at t - dt for some
+        # dt >= H. Bytes cannot have been input before t=0, so qdel[t][dt] is
+        # the constant False for dt > t rather than a variable
+        H = c.look_back()
+        if c.calculate_qdel and c.qdel_encoding == "bool":
+            self.qdel = [[s.Bool(f"{pre}qdel_{t},{dt}") if dt <= t
+                          else BoolVal(False) for dt in range(H)]
+                         for t in range(T)]
+            if H < T:
+                # Likewise, qdel_old[t] is False for t <= H
+                self.qdel_old = [s.Bool(f"{pre}qdel_old_{t}") if t > H
+                                 else BoolVal(False) for t in range(T)]
+        elif c.calculate_qdel:
+            assert(c.qdel_encoding == "int")
+            # qdel_idx[t] is the dt for which qdel[t][dt] is true, or -1 if
+            # there is no such dt (the bytes were input before t=0). qdel is
+            # then just a view of it, so code using qdel works unchanged
+            self.qdel_idx = [s.Int(f"{pre}qdel_idx_{t}") for t in range(T)]
+            self.qdel = [[self.qdel_idx[t] == dt if dt <= t
+                          else BoolVal(False) for dt in range(H)]
                          for t in range(T)]
+            if H < T:
+                self.qdel_old = [self.qdel_idx[t] >= H for t in range(T)]
 
         # This is for the non-composing model where waste is allowed only when
         # A - L and S come within epsilon of each other. See in 'config' for
@@ -75,15 +132,6 @@ class Variables(pyz3_utils.Variables):
         if not c.compose:
             self.epsilon = s.Real(f"{pre}epsilon")
 
-        # The number of dupacks that need to arrive before we declare that a
-        # loss has occured by dupacks. Z3 can usually pick any amount. You can
-        # also set dupacks = 3 * alpha to emulate the usual behavior
-        if c.dupacks is None:
-            self.dupacks = s.Real(f"{pre}dupacks")
-            s.add(self.dupacks >= 0)
-        else:
-            self.dupacks = c.dupacks
-
         # The MSS. Since C=1 (arbitrary units), C / alpha sets the link rate in
         # MSS/timestep. Typically we allow Z3 to pick any value it wants to
         # search through the set of all possible link rates
@@ -93,6 +141,34 @@ class Variables(pyz3_utils.Variables):
         else:
             self.alpha = c.alpha
 
+        # The number of dupacks that need to arrive before we declare that a
+        # loss has occured by dupacks. Z3 can usually pick any amount. You can
+        # also set dupacks = 3 * alpha to emulate the usual behavior
+        if self.fold_dupacks:
+            # cca_aimd would add dupacks == 3 * alpha
+            self.dupacks = 3 * self.alpha
+        elif c.dupacks is None:
+            self.dupacks = s.Real(f"{pre}dupacks")
+            s.add(self.dupacks >= 0)
+        else:
+            self.dupacks = c.dupacks
+
+        if self.fold_cwnd:
+            # cca_const would add cwnd == alpha
+            if isinstance(self.alpha, ArithRef):
+                cwnd = self.alpha
+            else:
+                cwnd = RealVal(self.alpha)
+            self.c_f = [[cwnd for t in range(T)] for n in range(c.N)]
+        if self.fold_rate:
+            # The rate each CCA would pin the rate variables to
+            if c.cca == "aimd" and not c.pacing:
+                self.r_f = [[RealVal(c.C * 100) for t in range(T)]
+                            for n in range(c.N)]
+            else:
+                self.r_f = [[self.c_f[n][t] / c.R for t in range(T)]
+                            for n in range(c.N)]
+
 
 class VariableNames:
     ''' Class with the same structure as Variables, but with just the names '''